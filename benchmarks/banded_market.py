@@ -0,0 +1,70 @@
+# Peak memory and time of the banded engine on a large lattice, for a few
+# band sizes. Each run is a fresh interpreter, so its peak resident memory
+# is its own.
+#
+#   python benchmarks/banded_market.py --length 4000 --steps 3 --bands 64 512 4000
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORKER = """
+import json, resource, sys, time
+from src.banded_market import BandedMarket
+length, steps, band_rows = map(int, sys.argv[1:4])
+directory = sys.argv[4]
+start = time.perf_counter()
+with BandedMarket(directory, length, band_rows=band_rows, seed=0) as market:
+    market.generate()
+    generated = time.perf_counter()
+    market.run(steps)
+    done = time.perf_counter()
+print(json.dumps({
+    "generate": generated - start,
+    "step": (done - generated) / steps,
+    "state_mib": market.state.dtype.itemsize * length**2 / 2**20,
+    "peak_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def measure(length: int, steps: int, band_rows: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        output = subprocess.run(
+            [sys.executable, "-c", WORKER, str(length), str(steps), str(band_rows), directory],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    measurement: Dict[str, Any] = json.loads(output)
+    return measurement
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Memory of the banded engine by band size.")
+    parser.add_argument("--length", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--bands", type=int, nargs="+", default=[64, 256, 2000])
+    arguments = parser.parse_args(argv)
+
+    for band_rows in arguments.bands:
+        measurement = measure(arguments.length, arguments.steps, band_rows)
+        if band_rows == arguments.bands[0]:
+            print(
+                f"{arguments.length}x{arguments.length} lattice, "
+                f"{measurement['state_mib']:.0f} MiB of state on disk"
+            )
+        print(
+            f"{band_rows:>6} rows per band: peak {measurement['peak_mib']:8.1f} MiB, "
+            f"{measurement['step']:6.2f} s per step, {measurement['generate']:6.2f} s to generate"
+        )
+
+
+if __name__ == "__main__":
+    main()
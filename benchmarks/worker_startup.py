@@ -0,0 +1,66 @@
+# Cold start of a sweep worker: a fresh interpreter that imports the
+# simulation core and runs one short experiment.
+#
+#   python benchmarks/worker_startup.py --repetitions 10
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from statistics import median
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("pandas", "plotly", "IPython", "ipykernel", "networkx", "numpy")
+
+WORKER = f"""
+import json, sys, time
+start = time.perf_counter()
+from src.sweep import ExperimentSpec, run_experiment
+imported = time.perf_counter()
+run_experiment(
+    ExperimentSpec(
+        parameters=dict(length=10, agent_types=2, producer_probability=0.1),
+        neighborhood="Moore",
+        seed=0,
+        max_steps=5,
+    )
+)
+done = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "run": done - imported,
+    "modules": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure() -> Dict[str, Any]:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    measurement: Dict[str, Any] = json.loads(output)
+    measurement["total"] = time.perf_counter() - start
+    return measurement
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Cold start of a sweep worker.")
+    parser.add_argument("--repetitions", type=int, default=5)
+    arguments = parser.parse_args(argv)
+
+    measurements = [measure() for _ in range(arguments.repetitions)]
+    for phase in ("import", "run", "total"):
+        print(f"{phase:>7}: {median(each[phase] for each in measurements) * 1000:8.1f} ms (median)")
+    print(f"modules: {', '.join(measurements[0]['modules'])}")
+
+
+if __name__ == "__main__":
+    main()
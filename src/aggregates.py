@@ -0,0 +1,32 @@
+from typing import Iterable
+
+import numpy as np
+
+
+class RunningMean:
+    def __init__(self, values: Iterable[float] = ()) -> None:
+        self.reset(values)
+
+    def __repr__(self) -> str:
+        return "{}(total={}, count={})".format(type(self).__name__, self.total, self.count)
+
+    @property
+    def value(self) -> float:
+        return self.total / self.count if self.count else np.nan
+
+    def reset(self, values: Iterable[float]) -> None:
+        self.total = 0.0
+        self.count = 0
+        for value in values:
+            self.add(value)
+
+    def add(self, value: float) -> None:
+        self.total = self.total + value
+        self.count = self.count + 1
+
+    def remove(self, value: float) -> None:
+        self.total = self.total - value
+        self.count = self.count - 1
+
+    def replace(self, old: float, new: float) -> None:
+        self.total = self.total + (new - old)
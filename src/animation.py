@@ -0,0 +1,304 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+from numpy.typing import NDArray
+from simulab.simulation.core.runner import Runner
+
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
+
+Array = NDArray[Any]
+
+
+class FrameDelta(NamedTuple):
+    cells: Array
+    values: Array
+    categories: Array
+
+
+class LatticeAnimation(NamedTuple):
+    steps: Array
+    values: Array
+    categories: Array
+    deltas: List[FrameDelta]
+
+    @property
+    def static(self) -> bool:
+        return len(self.steps) == 1
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.steps.nbytes
+            + self.values.nbytes
+            + self.categories.nbytes
+            + sum(array.nbytes for delta in self.deltas for array in delta)
+        )
+
+    def frames(self) -> Iterator[Tuple[int, Array, Array]]:
+        values = self.values.ravel().copy()
+        categories = self.categories.ravel().copy()
+        shape = self.values.shape
+        yield int(self.steps[0]), values.reshape(shape).copy(), categories.reshape(shape).copy()
+        for step, delta in zip(self.steps[1:], self.deltas):
+            values[delta.cells] = delta.values
+            categories[delta.cells] = delta.categories
+            yield int(step), values.reshape(shape).copy(), categories.reshape(shape).copy()
+
+    def categorized(self) -> List[List[List[Tuple[float, int]]]]:
+        # The kept frames in the nested (value, category) form of the
+        # categorized lattice series
+        return [
+            [list(zip(row, categories_row)) for row, categories_row in zip(values, categories)]
+            for _, values, categories in self.frames()
+        ]
+
+
+def _split(lattice: Sequence[Sequence[Tuple[float, int]]]) -> Tuple[Array, Array]:
+    cells = np.array(lattice, dtype=float)
+    return cells[..., 0], cells[..., 1].astype(np.int64)
+
+
+def _changed(previous: Array, current: Array) -> Array:
+    # NaN marks dead producers and empty cells, it is not a change by itself
+    return (previous != current) & ~(np.isnan(previous) & np.isnan(current))
+
+
+def encode_animation(
+    series: Sequence[Sequence[Sequence[Tuple[float, int]]]],
+    every: int = 1,
+    changed_only: bool = False,
+) -> LatticeAnimation:
+    assert every >= 1, "Frames should be kept every one step or more."
+    assert len(series) > 0, "There are no steps to animate."
+    last = len(series) - 1
+    # The last step is always kept, so the animation ends in the final state
+    # and its slider spans every step (with an empty delta if nothing changed)
+    kept = sorted(set(range(0, last + 1, every)) | {last})
+
+    values, categories = _split(series[0])
+    steps = [0]
+    deltas = []
+    current_values = values.ravel().copy()
+    current_categories = categories.ravel().copy()
+    for step in kept[1:]:
+        step_values, step_categories = (array.ravel() for array in _split(series[step]))
+        cells = np.flatnonzero(
+            _changed(current_values, step_values) | (current_categories != step_categories)
+        )
+        if changed_only and cells.size == 0 and step != last:
+            continue
+        current_values[cells] = step_values[cells]
+        current_categories[cells] = step_categories[cells]
+        steps.append(step)
+        deltas.append(FrameDelta(cells, step_values[cells], step_categories[cells]))
+
+    if all(delta.cells.size == 0 for delta in deltas):
+        # Nothing ever changes (e.g. the agent types): a single static frame
+        steps, deltas = [0], []
+    return LatticeAnimation(np.array(steps, dtype=np.int64), values, categories, deltas)
+
+
+def _heatmap(
+    values: Array,
+    categories: Array,
+    category: int | None,
+    zmin: float,
+    zmax: float,
+    colorscale: str,
+    show_labels: bool,
+) -> "go.Heatmap":
+    import plotly.graph_objs as go
+
+    visible = np.ones(values.shape, dtype=bool) if category is None else categories == category
+    labels = np.where(visible, categories.astype(str), "")
+    return go.Heatmap(
+        z=np.where(visible, values, np.nan),
+        text=labels if show_labels else None,
+        texttemplate="%{text}" if show_labels else None,
+        customdata=labels,
+        colorscale=colorscale,
+        showscale=True,
+        hovertemplate="<Category: %{customdata}> (%{y}, %{x}) = %{z}<extra></extra>",
+        zmin=zmin,
+        zmax=zmax,
+    )
+
+
+def _frame_args(duration: int) -> Dict[str, Any]:
+    return {
+        "frame": {"duration": duration},
+        "mode": "immediate",
+        "fromcurrent": True,
+        "transition": {"duration": duration, "easing": "linear"},
+    }
+
+
+def animation_figure(
+    animation: LatticeAnimation,
+    plot_title: str,
+    agent_types: int,
+    height: int | None = None,
+    width: int | None = None,
+    speed: float = 1 / 10,
+    all_categories_name: str = "All",
+    colorscale: str = "Viridis",
+    show_labels: bool = False,
+    zmin: float | None = None,
+    zmax: float | None = None,
+) -> "go.Figure":
+    import plotly.graph_objs as go
+
+    assert 0 < speed <= 1, "Speed value should be between 0 and 1."
+    frames = list(animation.frames())
+    zmin = np.nanmin([np.nanmin(values) for _, values, _ in frames]) if zmin is None else zmin
+    zmax = np.nanmax([np.nanmax(values) for _, values, _ in frames]) if zmax is None else zmax
+    categories: List[int | None] = [None, *range(agent_types)]
+    names = [all_categories_name] + [str(category) for category in range(agent_types)]
+
+    def traces(values: Array, types: Array) -> List["go.Heatmap"]:
+        return [
+            _heatmap(values, types, category, zmin, zmax, colorscale, show_labels)
+            for category in categories
+        ]
+
+    # Plotly frames replace a heatmap's z as a whole, so each kept step is
+    # exported with full lattices: only the decimation shrinks the figure.
+    _, first_values, first_categories = frames[0]
+    figure = go.Figure(
+        data=traces(first_values, first_categories),
+        frames=(
+            [
+                go.Frame(data=traces(values, types), name=f"Step {step}")
+                for step, values, types in frames
+            ]
+            if not animation.static
+            else []
+        ),
+    )
+    for trace, name in zip(figure.data, names):
+        trace.visible = name == all_categories_name
+
+    size = height if height else 600
+    updatemenus: List[Dict[str, Any]] = [
+        {
+            "type": "dropdown",
+            "buttons": [
+                {
+                    "label": name,
+                    "method": "update",
+                    "args": [
+                        {"visible": [each == name for each in names]},
+                        {"title": f"{plot_title}<br>Category: {name}"},
+                    ],
+                }
+                for name in names
+            ],
+            "direction": "down",
+            "showactive": True,
+            "yanchor": "bottom",
+        }
+    ]
+    sliders = []
+    if not animation.static:
+        updatemenus.append(
+            {
+                "type": "buttons",
+                "buttons": [
+                    {
+                        "label": "&#9654;",  # play symbol
+                        "method": "animate",
+                        "args": [None, _frame_args(int(1000 * speed))],
+                    },
+                    {
+                        "label": "&#9724;",  # pause symbol
+                        "method": "animate",
+                        "args": [[None], _frame_args(0)],
+                    },
+                ],
+                "direction": "left",
+                "pad": {"r": 10, "t": 70},
+                "x": 0.1,
+                "y": 0,
+            }
+        )
+        sliders.append(
+            {
+                "pad": {"b": 10, "t": 60},
+                "len": 1,
+                "x": 0.1,
+                "y": 0,
+                "steps": [
+                    {
+                        "args": [[f"Step {step}"], _frame_args(0)],
+                        "label": str(step),
+                        "method": "animate",
+                    }
+                    for step, _, _ in frames
+                ],
+            }
+        )
+
+    figure.update_layout(
+        title=plot_title,
+        title_x=0.5,
+        width=size if not width else width,
+        height=size,
+        margin=dict(r=150),
+        xaxis=dict(
+            title="X",
+            side="bottom",
+            tickmode="linear",
+            tick0=0,
+            dtick=5,
+            scaleanchor="y",
+            scaleratio=1,
+            constrain="domain",
+        ),
+        yaxis=dict(
+            title="Y",
+            tickmode="linear",
+            tick0=0,
+            dtick=5,
+            autorange="reversed",
+            scaleanchor="x",
+            scaleratio=1,
+            constrain="domain",
+        ),
+        updatemenus=updatemenus,
+        sliders=sliders,
+    )
+    return figure
+
+
+def show_animation(
+    series_name: str,
+    runner: Runner,
+    experiment_id: int,
+    plot_title: str,
+    every: int = 1,
+    changed_only: bool = True,
+    **options: Any,
+) -> "go.Figure":
+    assert (
+        0 <= experiment_id < len(runner.experiments)
+    ), f"Experiment id should be in [0, {len(runner.experiments)-1}]"
+    experiment = runner.experiments[experiment_id]
+    parameters = set(options.pop("attributes_to_consider", None) or []).union(
+        runner.experiment_parameters_set.parameters_to_vary
+    )
+    details = "<br>".join(f"{name}={getattr(experiment, name)}" for name in parameters)
+    plot_title = f"{plot_title}<br>{details}"
+    animation = encode_animation(experiment.series[series_name], every, changed_only)
+    figure = animation_figure(animation, plot_title, experiment.agent_types, **options)
+    figure.show()
+    return figure
@@ -0,0 +1,439 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+from simulab.simulation.core.lattice import Lattice
+
+from src.consumer import Consumer
+from src.producer import Producer
+from src.sweep import neighborhood_from
+
+Array = NDArray[Any]
+
+# Per cell state, as one record per cell in a single mapped file
+STATE = np.dtype(
+    [
+        ("agent_type", np.int8),
+        ("price", np.float64),
+        ("previous_price", np.float64),
+        ("capital", np.float64),
+        ("last_profit", np.float64),
+        ("previous_profit", np.float64),
+        ("marginal_cost", np.float64),
+        ("fixed_cost", np.float64),
+        ("stock", np.float64),
+        ("sales", np.float64),
+        ("sales_within_period", np.float64),
+        ("profit_period", np.int32),
+        ("factor", np.int8),
+        ("bankrupted", np.bool_),
+    ]
+)
+# Recordable per step, with the layout of the golden traces: producer
+# fields are NaN on consumers
+RECORDABLE = ("price", "previous_price", "last_profit", "previous_profit", "capital", "bankrupted")
+NUMERIC_SERIES = (
+    "average_price",
+    "average_consumer_price",
+    "average_producer_price",
+    "average_profit",
+    "alive_producers",
+)
+# Sums and counts per band, from which the numeric series are computed
+TOTALS = 8
+
+
+def neighborhood_offsets(name: str) -> List[Tuple[int, int]]:
+    # In the neighborhood's own order, which breaks ties between sellers
+    center = 1_000
+    neighborhood = neighborhood_from(name)(2 * center + 1)
+    return [(i - center, j - center) for i, j in neighborhood.indexes_for(center, center)]
+
+
+class MappedLattice:
+    # A (rows x length) array in a file, read and written by rows. Every
+    # access maps only the rows it needs and copies them, so the resident
+    # memory stays bounded by the rows in use instead of the whole file.
+    def __init__(self, path: Path, dtype: Any, length: int, offset: int = 0) -> None:
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = length
+        self.offset = offset
+        self.__file = open(path, "r+b")
+
+    def __repr__(self) -> str:
+        return "{}(path={}, dtype={}, length={})".format(
+            type(self).__name__,
+            self.path,
+            self.dtype,
+            self.length,
+        )
+
+    def __enter__(self) -> "MappedLattice":
+        return self
+
+    def __exit__(self, *exception: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.__file.close()
+
+    @classmethod
+    def create(cls, path: Path, dtype: Any, length: int) -> "MappedLattice":
+        with open(path, "wb") as file:
+            file.truncate(length * length * np.dtype(dtype).itemsize)
+        return cls(path, dtype, length)
+
+    @classmethod
+    def create_npy(cls, path: Path, steps: int, length: int) -> "MappedLattice":
+        # A (steps x length x length) .npy file, whose row of step t and
+        # lattice row i is t * length + i
+        output = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float64, shape=(steps, length, length)
+        )
+        lattice = cls(path, np.float64, length, offset=output.offset)
+        del output
+        return lattice
+
+    def __segments(self, rows: Array) -> Iterator[Tuple[int, int, int]]:
+        # Runs of consecutive rows, as (first row, position in rows, count)
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        for start, stop in zip(np.r_[0, breaks], np.r_[breaks, len(rows)]):
+            yield int(rows[start]), int(start), int(stop - start)
+
+    def __map(self, row: int, count: int) -> "np.memmap[Any, Any]":
+        return np.memmap(
+            self.__file,
+            dtype=self.dtype,
+            mode="r+",
+            offset=self.offset + row * self.length * self.dtype.itemsize,
+            shape=(count, self.length),
+        )
+
+    def read(self, rows: Array) -> Array:
+        values = np.empty((len(rows), self.length), dtype=self.dtype)
+        for row, position, count in self.__segments(rows):
+            mapped = self.__map(row, count)
+            values[position : position + count] = mapped
+            del mapped
+        return values
+
+    def write(self, rows: Array, values: Array) -> None:
+        for row, position, count in self.__segments(rows):
+            mapped = self.__map(row, count)
+            mapped[:] = values[position : position + count]
+            del mapped
+
+    def add(self, rows: Array, field: str, values: Array) -> None:
+        # Rows may repeat when the halo wraps around a small lattice
+        unique, inverse = np.unique(rows, return_inverse=True)
+        records = self.read(unique)
+        if len(unique) == len(rows):
+            records[field][inverse] += values
+        else:
+            np.add.at(records[field], inverse, values)
+        self.write(unique, records)
+
+
+class BandedMarket:
+    # The Market rules on plain arrays backed by files, for lattices whose
+    # agents do not fit in memory. Steps stream through the lattice in bands
+    # of `band_rows` rows: consumers buy from the cheapest producer around
+    # them, reading `radius` extra rows above and below, and then producers
+    # update their prices and capitals row by row. Consumer amounts and
+    # initial producers are drawn from one random stream per row and step,
+    # so the results do not depend on the band size.
+    def __init__(
+        self,
+        directory: str | Path,
+        length: int,
+        neighborhood: str = "ExpandedMoore(3)",
+        band_rows: int = 256,
+        seed: int = 0,
+        capital: float = 1_000_000,
+        stock: int = 5_000_000_000,
+        price_ratio: Tuple[float, float] = (1.1, 2),
+        fixed_cost: Tuple[float, float] = (250_000, 10_000),
+        marginal_cost: Tuple[float, float] = (30.0, 5.0),
+        quantity_to_buy: Tuple[float, float] = (4000, 1500),
+        profit_period: int = 5,
+        producer_probability: float = 0.1,
+        bankrupt_enabled: bool = False,
+        delta_price: float = 0.02,
+        recorded: Tuple[str, ...] = ("price",),
+    ) -> None:
+        assert band_rows >= 1, "Bands should have one row or more."
+        unknown = set(recorded) - set(RECORDABLE)
+        assert not unknown, f"Can not record {sorted(unknown)}, expected some of {RECORDABLE}."
+        self.directory = Path(directory)
+        self.length = length
+        self.neighborhood = neighborhood
+        self.offsets = neighborhood_offsets(neighborhood)
+        self.radius = max(abs(i) for i, _ in self.offsets)
+        self.columns = max(abs(j) for _, j in self.offsets)
+        self.band_rows = band_rows
+        self.seed = seed
+        self.capital = capital
+        self.stock = stock
+        self.price_ratio = price_ratio
+        self.fixed_cost = fixed_cost
+        self.marginal_cost = marginal_cost
+        self.quantity_to_buy = quantity_to_buy
+        self.profit_period = profit_period
+        self.producer_probability = producer_probability
+        self.bankrupt_enabled = bankrupt_enabled
+        self.delta_price = delta_price
+        self.recorded = recorded
+        self.step_count = 0
+        self.series: Dict[str, List[float]] = {name: [] for name in NUMERIC_SERIES}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.state = MappedLattice.create(self.directory / "state.bin", STATE, length)
+        self.__outputs: Dict[str, MappedLattice] = {}
+        self.__recorded_steps = 0
+
+    def __enter__(self) -> "BandedMarket":
+        return self
+
+    def __exit__(self, *exception: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Recorded series stay readable, mapped from their files
+        self.state.close()
+        self.__close_outputs()
+
+    def __close_outputs(self) -> None:
+        for output in self.__outputs.values():
+            output.close()
+
+    def __repr__(self) -> str:
+        return "{}(directory={}, length={}, neighborhood={}, band_rows={}, steps={})".format(
+            type(self).__name__,
+            self.directory,
+            self.length,
+            self.neighborhood,
+            self.band_rows,
+            self.step_count,
+        )
+
+    def bands(self) -> Iterator[Array]:
+        for start in range(0, self.length, self.band_rows):
+            yield np.arange(start, min(start + self.band_rows, self.length))
+
+    def __rng(self, stage: int, row: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, stage, row])
+
+    # Initial state
+    def generate(self) -> None:
+        for rows in self.bands():
+            band = np.zeros((len(rows), self.length), dtype=STATE)
+            for k, row in enumerate(rows):
+                rng = self.__rng(0, int(row))
+                producers = rng.random(self.length) < self.producer_probability
+                marginal_cost = np.abs(rng.normal(*self.marginal_cost, size=self.length))
+                price = marginal_cost * rng.uniform(*self.price_ratio, size=self.length)
+                fixed_cost = np.abs(rng.normal(*self.fixed_cost, size=self.length))
+                factor = rng.integers(0, 2, size=self.length) * 2 - 1
+                band["agent_type"][k] = np.where(producers, Producer.TYPE, Consumer.TYPE)
+                band["price"][k] = np.where(producers, price, 0)
+                band["previous_price"][k] = np.where(producers, price, 0)
+                band["marginal_cost"][k] = np.where(producers, marginal_cost, 0)
+                band["fixed_cost"][k] = np.where(producers, fixed_cost, 0)
+                band["capital"][k] = np.where(producers, self.capital, 0)
+                band["stock"][k] = np.where(producers, self.stock, 0)
+                band["profit_period"][k] = np.where(producers, self.profit_period, 0)
+                band["factor"][k] = np.where(producers, factor, 0)
+            self.state.write(rows, band)
+
+    def load_agents(self, configuration: Lattice) -> None:
+        # Copies the agents of a (small) Market, e.g. to replay its runs
+        for rows in self.bands():
+            band = np.zeros((len(rows), self.length), dtype=STATE)
+            for k, i in enumerate(rows):
+                for j in range(self.length):
+                    agent = configuration.at(int(i), j)
+                    band["agent_type"][k, j] = agent.agent_type
+                    band["price"][k, j] = agent.price
+                    if agent.agent_type == Producer.TYPE:
+                        formula = agent.profit_formula
+                        band["previous_price"][k, j] = formula.previous_price
+                        band["capital"][k, j] = agent.capital
+                        band["last_profit"][k, j] = formula.last_profit
+                        band["previous_profit"][k, j] = formula.previous_profit
+                        band["marginal_cost"][k, j] = formula.marginal_cost
+                        band["fixed_cost"][k, j] = formula.fixed_cost
+                        band["stock"][k, j] = agent.stock
+                        band["sales_within_period"][k, j] = formula.sales_within_period
+                        band["profit_period"][k, j] = formula.profit_period
+                        band["factor"][k, j] = formula._ProfitFormula__current_factor
+                        band["bankrupted"][k, j] = agent.bankrupted
+            self.state.write(rows, band)
+
+    # Steps
+    def __available(self, band: Array) -> Array:
+        available = band["agent_type"] == Producer.TYPE
+        if self.bankrupt_enabled:
+            available &= ~band["bankrupted"]
+        return available
+
+    def __buy(self, rows: Array) -> None:
+        radius, length = self.radius, self.length
+        halo_rows = np.arange(rows[0] - radius, rows[-1] + radius + 1) % length
+        halo = self.state.read(halo_rows)
+        offers = np.where(self.__available(halo), halo["price"], np.inf)
+        # Columns wrap around too
+        width = self.columns
+        offers = offers[:, np.arange(-width, length + width) % length]
+
+        # The first cheapest seller in the neighborhood order, as Consumer.buy
+        best = np.full((len(rows), length), np.inf)
+        choice = np.full((len(rows), length), -1)
+        for index, (di, dj) in enumerate(self.offsets):
+            shifted = offers[
+                radius + di : radius + di + len(rows), width + dj : width + dj + length
+            ]
+            cheaper = shifted < best
+            np.copyto(best, shifted, where=cheaper)
+            np.copyto(choice, index, where=cheaper)
+
+        band = halo[radius : radius + len(rows)]
+        buying = (band["agent_type"] == Consumer.TYPE) & (choice >= 0)
+        band["price"] = np.where(buying, best, band["price"])
+        amounts = np.stack(
+            [
+                self.__rng(self.step_count, int(row)).normal(*self.quantity_to_buy, size=length)
+                for row in rows
+            ]
+        )
+
+        k, j = np.nonzero(buying)
+        offsets = np.array(self.offsets)[choice[k, j]]
+        sellers = (k + radius + offsets[:, 0]) * length + (j + offsets[:, 1]) % length
+        sales = np.bincount(sellers, weights=amounts[k, j], minlength=len(halo_rows) * length)
+        self.state.write(rows, band)
+        self.state.add(halo_rows, "sales", sales.reshape(len(halo_rows), length))
+
+    def __balance(self, rows: Array) -> Array:
+        band = self.state.read(rows)
+        if (band["sales"] > band["stock"]).any():
+            raise AssertionError("Insufficient stock")
+        active = band["agent_type"] == Producer.TYPE
+        if self.bankrupt_enabled:
+            active &= ~band["bankrupted"]
+        band["stock"] = band["stock"] - np.where(active, band["sales"], 0)
+
+        # ProfitFormula.check, for every active producer at once
+        band["profit_period"] = band["profit_period"] - active
+        band["sales_within_period"] = band["sales_within_period"] + np.where(
+            active, band["sales"], 0
+        )
+        finished = active & (band["profit_period"] <= 0)
+        price, within = band["price"], band["sales_within_period"]
+        profit = (price - band["marginal_cost"]) * within - band["fixed_cost"]
+        increased = profit >= band["last_profit"]
+        factor = np.where(
+            within == 0,
+            -1,
+            np.where(
+                ~increased | (price == band["marginal_cost"]), -band["factor"], band["factor"]
+            ),
+        )
+        new_price = np.maximum(band["marginal_cost"], price * (1 + self.delta_price * factor))
+        capital = band["capital"] + profit
+        updates = {
+            "previous_price": price,
+            "previous_profit": band["last_profit"],
+            "last_profit": profit,
+            "factor": factor,
+            "price": new_price,
+            "profit_period": self.profit_period,
+            "sales_within_period": 0,
+            "capital": capital,
+            "bankrupted": capital <= 0,
+        }
+        for name, value in updates.items():
+            band[name] = np.where(finished, value, band[name])
+        band["sales"] = np.where(active, 0, band["sales"])
+        self.state.write(rows, band)
+        return band
+
+    def step(self) -> None:
+        assert not self.__outputs or self.step_count + 1 < self.__recorded_steps, (
+            f"Recorded series have room for {self.__recorded_steps - 1} steps, "
+            "run() allocates them."
+        )
+        self.step_count += 1
+        # Every consumer buys before any producer updates its price
+        for rows in self.bands():
+            self.__buy(rows)
+        totals = np.zeros(TOTALS)
+        for rows in self.bands():
+            band = self.__balance(rows)
+            totals += self.__record(rows, band)
+        self.__append_series(totals)
+
+    # Series
+    def __record(self, rows: Array, band: Array) -> Array:
+        producers = band["agent_type"] == Producer.TYPE
+        consumers = ~producers
+        alive = producers & ~band["bankrupted"] if self.bankrupt_enabled else producers
+        for name, output in self.__outputs.items():
+            values = band[name].astype(float)
+            if name != "price":
+                values = np.where(producers, values, np.nan)
+            output.write(self.step_count * self.length + rows, values)
+        price = band["price"]
+        return np.array(
+            [
+                price.sum(),
+                (producers & ~alive).sum(),
+                price[consumers].sum(),
+                consumers.sum(),
+                price[producers].sum(),
+                producers.sum(),
+                band["last_profit"][alive].sum(),
+                alive.sum(),
+            ]
+        )
+
+    def __append_series(self, totals: Array) -> None:
+        prices, dead, consumer_prices, consumers, producer_prices, producers, profits, alive = (
+            totals
+        )
+
+        def mean(total: float, count: float) -> float:
+            return total / count if count else np.nan
+
+        # Prices of bankrupted producers are NaN on Market's price lattice
+        self.series["average_price"].append(np.nan if dead else prices / self.length**2)
+        self.series["average_consumer_price"].append(mean(consumer_prices, consumers))
+        self.series["average_producer_price"].append(mean(producer_prices, producers))
+        self.series["average_profit"].append(mean(profits, alive))
+        self.series["alive_producers"].append(float(alive))
+
+    def run(self, max_steps: int) -> Dict[str, List[float]]:
+        (self.directory / "series").mkdir(exist_ok=True)
+        self.__close_outputs()
+        self.__recorded_steps = max_steps + 1
+        for name in self.recorded:
+            path = self.directory / "series" / f"{name}.npy"
+            self.__outputs[name] = MappedLattice.create_npy(
+                path, self.__recorded_steps, self.length
+            )
+        self.step_count = 0
+        self.series = {name: [] for name in NUMERIC_SERIES}
+        totals = np.zeros(TOTALS)
+        for rows in self.bands():
+            totals += self.__record(rows, self.state.read(rows))
+        self.__append_series(totals)
+        for _ in range(max_steps):
+            self.step()
+        with open(self.directory / "series" / "numeric.json", "w") as file:
+            json.dump(self.series, file)
+        return self.series
+
+    def recorded_series(self, name: str) -> Array:
+        # (steps x length x length), mapped from its file
+        return np.load(self.__outputs[name].path, mmap_mode="r")
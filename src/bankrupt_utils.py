@@ -1,15 +1,24 @@
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Tuple
 
 import numpy as np
+from numpy.typing import NDArray
 from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
 from simulab.simulation.core.experiment import ExperimentParametersSet
 from simulab.simulation.core.lattice import Lattice
 from simulab.simulation.core.neighborhood import ExpandedMoore
 from simulab.simulation.core.runner import Runner
 
+from src.bankruptcy import BankruptcyEvent
+from src.common_random import CommonRandomNumbers
 from src.consumer import Consumer
 from src.market import Market
 from src.producer import Producer
+from src.sweep import (
+    CAPITAL_STATISTICS,
+    ExperimentResult,
+    ExperimentSpec,
+    summary_of,
+)
 
 length = 20
 capital = 1_000
@@ -22,8 +31,21 @@ marginal_cost = (10, 1)
 quantity_to_buy = (1, 0)
 criterion = WithoutCriterion()
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def create_configuration(producer_probability: float = producer_probability) -> Lattice:
+Array = NDArray[Any]
+
+
+def create_configuration(
+    producer_probability: float = producer_probability,
+    crn_seed: int | None = None,
+    antithetic: bool = False,
+) -> Lattice:
+    # With a crn_seed, configurations for different probabilities share their
+    # producers' costs and initial factors (see src.common_random)
+    if crn_seed is not None:
+        return _common_configuration(producer_probability, crn_seed, antithetic)
     configuration = Lattice.with_probability(producer_probability, length)
 
     for i in range(length):
@@ -46,6 +68,30 @@ def create_configuration(producer_probability: float = producer_probability) ->
     return configuration
 
 
+def _common_configuration(producer_probability: float, crn_seed: int, antithetic: bool) -> Lattice:
+    numbers = CommonRandomNumbers(crn_seed, length, antithetic=antithetic)
+    configuration = numbers.layout(producer_probability)
+
+    for i in range(length):
+        for j in range(length):
+            agent_type = configuration.at(i, j)
+            if agent_type == Consumer.TYPE:
+                agent = Consumer()
+            else:
+                agent = numbers.producer(
+                    i,
+                    j,
+                    capital=capital,
+                    stock=stock,
+                    price_ratio=price_ratio,
+                    fixed_cost=fixed_cost,
+                    marginal_cost=marginal_cost,
+                    profit_period=profit_period,
+                )
+            configuration.set(i, j, _with=agent)
+    return configuration
+
+
 def parameters_with(
     configuration: Lattice, bankrupt_enabled: bool = False
 ) -> ExperimentParametersSet:
@@ -73,6 +119,160 @@ def bankrupted_on(runner: Runner) -> List[bool]:
     ]
 
 
+def bankruptcy_events(runner: Runner) -> List[BankruptcyEvent]:
+    # The producers bankrupted at the end of the run, with their step and capital
+    return runner.experiments[0].bankruptcy_log.current()
+
+
+def strategy_spec(
+    producer_probability: float = producer_probability,
+    crn_seed: int = 0,
+    bankrupt_enabled: bool = False,
+    max_steps: int = 1000,
+    antithetic: bool = False,
+) -> ExperimentSpec:
+    # The experiment of parameters_with(create_configuration(...)) for the
+    # sweep machinery: workers build the same configuration from crn_seed
+    # instead of receiving it.
+    return ExperimentSpec(
+        parameters=dict(
+            length=length,
+            agent_types=2,
+            capital=capital,
+            stock=stock,
+            producer_probability=producer_probability,
+            profit_period=profit_period,
+            price_ratio=price_ratio,
+            fixed_cost=fixed_cost,
+            marginal_cost=marginal_cost,
+            quantity_to_buy=quantity_to_buy,
+            bankrupt_enabled=bankrupt_enabled,
+            crn_seed=crn_seed,
+            antithetic=antithetic,
+        ),
+        neighborhood="ExpandedMoore(3)",
+        seed=crn_seed,
+        max_steps=max_steps,
+    )
+
+
+def strategy_label(spec: ExperimentSpec) -> str:
+    parameters = spec.parameters
+    strategy = "Con" if parameters["bankrupt_enabled"] else "Sin"
+    return f"{strategy} bancarrota (prob: {parameters['producer_probability']})"
+
+
+def run_summary(
+    configuration: Lattice,
+    max_steps: int = 1000,
+    bankrupt_enabled: bool = False,
+) -> Dict[str, float]:
+    # Only the scalars outlive the runner and its series
+    params = parameters_with(configuration, bankrupt_enabled=bankrupt_enabled)
+    runner = Runner(Market, params, criterion, max_steps=max_steps)
+    runner.start()
+    return summary_of(runner.experiments[0])
+
+
+class StrategySummary:
+    # Per-run scalars of strategy experiments, one row per run, in columns
+    # allocated for `capacity` runs and doubled when full. Strategies are
+    # stored as codes of their labels.
+    COLUMNS: Tuple[Tuple[str, Any], ...] = (
+        ("strategy", np.int32),
+        ("seed", np.int64),
+        ("bankrupt", np.int64),
+        ("solvent", np.int64),
+        *((name, np.float64) for name in CAPITAL_STATISTICS),
+    )
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.__rows = 0
+        self.__strategies: Dict[str, int] = {}
+        self.__columns = {name: np.empty(max(capacity, 1), dtype) for name, dtype in self.COLUMNS}
+
+    def __repr__(self) -> str:
+        return "{}(rows={}, strategies={})".format(
+            type(self).__name__,
+            self.__rows,
+            list(self.__strategies),
+        )
+
+    def __len__(self) -> int:
+        return self.__rows
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__columns["strategy"])
+
+    def add(self, strategy: str, seed: int | None, summary: Mapping[str, float]) -> None:
+        # summary as in src.sweep.summary_of; seed is -1 for unseeded runs
+        if self.__rows == self.capacity:
+            self.__grow()
+        row = self.__rows
+        columns = self.__columns
+        columns["strategy"][row] = self.__strategies.setdefault(strategy, len(self.__strategies))
+        columns["seed"][row] = -1 if seed is None else seed
+        columns["bankrupt"][row] = summary["bankruptcies"]
+        columns["solvent"][row] = summary["solvent"]
+        for name in CAPITAL_STATISTICS:
+            columns[name][row] = summary[name]
+        self.__rows += 1
+
+    def add_result(self, result: ExperimentResult, strategy: str | None = None) -> None:
+        seed = result.spec.parameters.get("crn_seed", result.spec.seed)
+        self.add(strategy or strategy_label(result.spec), seed, result.summary)
+
+    def __grow(self) -> None:
+        for name, column in self.__columns.items():
+            grown = np.empty(2 * len(column), column.dtype)
+            grown[: self.__rows] = column[: self.__rows]
+            self.__columns[name] = grown
+
+    def columns(self) -> Dict[str, Array]:
+        # Views of the filled rows, with strategy codes
+        return {name: column[: self.__rows] for name, column in self.__columns.items()}
+
+    def strategies(self) -> List[str]:
+        return list(self.__strategies)
+
+    def to_frame(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        columns: Dict[str, Any] = dict(self.columns())
+        columns["strategy"] = pd.Categorical.from_codes(
+            columns["strategy"], categories=self.strategies()
+        )
+        columns["seed"] = pd.arrays.IntegerArray(columns["seed"].copy(), columns["seed"] < 0)
+        return pd.DataFrame(columns)
+
+    def counts_frame(self) -> "pd.DataFrame":
+        # Two rows per run, as execute_with used to collect them for charts
+        import pandas as pd
+
+        columns = self.columns()
+        return pd.DataFrame(
+            {
+                "Capital": np.tile(["sin capital", "con capital"], self.__rows),
+                "Cantidad": np.column_stack((columns["bankrupt"], columns["solvent"])).ravel(),
+                "Estrategia": np.repeat(
+                    np.array(self.strategies(), dtype=object)[columns["strategy"]], 2
+                ),
+            }
+        )
+
+
+def run_strategy(
+    configuration: Lattice,
+    summary: StrategySummary,
+    strategy_name: str,
+    seed: int | None = None,
+    max_steps: int = 1000,
+    bankrupt_enabled: bool = False,
+) -> None:
+    summary.add(strategy_name, seed, run_summary(configuration, max_steps, bankrupt_enabled))
+
+
 def execute_with(
     configuration: Lattice,
     data: Dict[str, List[Any]],
@@ -80,15 +280,8 @@ def execute_with(
     max_steps: int = 1000,
     bankrupt_enabled: bool = False,
 ) -> None:
-    params = parameters_with(configuration, bankrupt_enabled=bankrupt_enabled)
-    runner = Runner(Market, params, criterion, max_steps=max_steps)
-    runner.start()
-    producer_positions = set(runner.experiments[0]._by_type[1])
-    producers_amount = len(producer_positions)
-    current_bankrupted = bankrupted_on(runner).count(True)
-    data["Capital"] = data["Capital"] + ["sin capital", "con capital"]
-    data["Cantidad"] = data["Cantidad"] + [
-        current_bankrupted,
-        producers_amount - current_bankrupted,
-    ]
-    data["Estrategia"] = data["Estrategia"] + ([strategy_name] * 2)
+    # Prefer run_strategy with a StrategySummary, which keeps more of each run
+    summary = run_summary(configuration, max_steps, bankrupt_enabled)
+    data.setdefault("Capital", []).extend(["sin capital", "con capital"])
+    data.setdefault("Cantidad", []).extend([int(summary["bankruptcies"]), int(summary["solvent"])])
+    data.setdefault("Estrategia", []).extend([strategy_name] * 2)
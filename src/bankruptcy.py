@@ -0,0 +1,52 @@
+from typing import Any, Dict, List, NamedTuple, Set, Tuple
+
+
+class BankruptcyEvent(NamedTuple):
+    step: int
+    position: Tuple[int, int]
+    capital: float
+    # False when a producer recovers, which only happens without bankrupt_enabled
+    bankrupted: bool = True
+
+
+class BankruptcyLog:
+    def __init__(self, producers: int) -> None:
+        self.producers = producers
+        self.step = 0
+        self.events: List[BankruptcyEvent] = []
+        self.__bankrupted: Set[Tuple[int, int]] = set()
+
+    def __repr__(self) -> str:
+        return "{}(producers={}, bankrupted={}, events={})".format(
+            type(self).__name__,
+            self.producers,
+            self.bankrupted,
+            len(self.events),
+        )
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "BankruptcyLog":
+        # The lattice (and so every producer) is copied on each step, but all
+        # the copies must keep reporting to the same log.
+        return self
+
+    @property
+    def bankrupted(self) -> int:
+        return len(self.__bankrupted)
+
+    @property
+    def alive(self) -> int:
+        return self.producers - len(self.__bankrupted)
+
+    def is_bankrupted(self, position: Tuple[int, int]) -> bool:
+        return position in self.__bankrupted
+
+    def register(self, position: Tuple[int, int], capital: float, bankrupted: bool) -> None:
+        self.events.append(BankruptcyEvent(self.step, position, capital, bankrupted))
+        if bankrupted:
+            self.__bankrupted.add(position)
+        else:
+            self.__bankrupted.discard(position)
+
+    def current(self) -> List[BankruptcyEvent]:
+        latest = {event.position: event for event in self.events}
+        return [event for event in latest.values() if event.bankrupted]
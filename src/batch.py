@@ -0,0 +1,239 @@
+import argparse
+import csv
+import importlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import traceback
+from concurrent.futures import Executor, Future, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+from src.cache import ResultCache, stable_hash
+from src.sweep import (
+    ExperimentResult,
+    ExperimentSpec,
+    measured_result,
+    run_experiment,
+    run_measured,
+    sweep_specs,
+    worker_pool,
+)
+from src.telemetry import Telemetry
+
+RESULT_SUFFIX = ".pickle"
+TEMPORARY_PREFIX = ".tmp-"
+SUMMARIES = "summaries.csv"
+
+
+class Job(NamedTuple):
+    id: str
+    name: str
+    spec: ExperimentSpec
+
+
+def _parameters(entry: Dict[str, Any]) -> Dict[str, Any]:
+    # JSON has no tuples, and Market expects (mean, deviation) pairs as tuples
+    parameters = {
+        name: tuple(value) if isinstance(value, list) and name != "configuration" else value
+        for name, value in entry.get("parameters", {}).items()
+    }
+    scenario = entry.get("scenario")
+    if scenario is not None:
+        configuration = importlib.import_module(f"scenarios.{scenario}").config
+        parameters["configuration"] = configuration
+        parameters.setdefault("length", len(configuration))
+    # Without a scenario nor a configuration, Market generates the lattice
+    # from producer_probability with the job's seed.
+    parameters.setdefault("agent_types", 2)
+    return parameters
+
+
+def jobs_from(manifest: Dict[str, Any]) -> List[Job]:
+    defaults = manifest.get("defaults", {})
+    jobs: Dict[str, Job] = {}
+    for index, _entry in enumerate(manifest["experiments"]):
+        entry = {
+            **defaults,
+            **_entry,
+            "parameters": {**defaults.get("parameters", {}), **_entry.get("parameters", {})},
+        }
+        name = entry.get("name", f"experiment-{index}")
+        base = ExperimentSpec(
+            parameters=_parameters(entry),
+            neighborhood=entry.get("neighborhood", ExperimentSpec._field_defaults["neighborhood"]),
+            max_steps=entry.get("max_steps", ExperimentSpec._field_defaults["max_steps"]),
+            series=tuple(entry.get("series", ())),
+        )
+        varying = {
+            parameter: [tuple(value) if isinstance(value, list) else value for value in values]
+            for parameter, values in entry.get("vary", {}).items()
+        }
+        if "seeds" in entry:
+            specs = [
+                spec._replace(seed=seed)
+                for seed in entry["seeds"]
+                for spec in sweep_specs(base, 1, 0, **varying)
+            ]
+        else:
+            specs = sweep_specs(
+                base,
+                repetitions=entry.get("repetitions", 1),
+                seed=entry.get("seed", 0),
+                **varying,
+            )
+        for spec in specs:
+            # Jobs are named after their content, so an edited manifest reruns
+            # exactly the experiments that changed.
+            job = Job(f"{name}-{stable_hash(spec._asdict())[:16]}", name, spec)
+            jobs.setdefault(job.id, job)
+    return list(jobs.values())
+
+
+def load_manifest(path: str | Path) -> Dict[str, Any]:
+    with open(path) as file:
+        manifest: Dict[str, Any] = json.load(file)
+    if not isinstance(manifest.get("experiments"), list):
+        raise ValueError(f"The manifest {path} should have a list of 'experiments'.")
+    return manifest
+
+
+def _result_path(output: Path, job: Job) -> Path:
+    return output / f"{job.id}{RESULT_SUFFIX}"
+
+
+def write_result(output: Path, job: Job, result: ExperimentResult) -> None:
+    # Written aside and atomically renamed, so an interrupted batch never
+    # leaves a partial result that would be taken as completed.
+    with tempfile.NamedTemporaryFile(dir=output, prefix=TEMPORARY_PREFIX, delete=False) as file:
+        pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file.name, _result_path(output, job))
+
+
+def load_results(output: str | Path) -> Dict[str, ExperimentResult]:
+    results = {}
+    for path in sorted(Path(output).glob(f"*{RESULT_SUFFIX}")):
+        with open(path, "rb") as file:
+            results[path.stem] = pickle.load(file)
+    return results
+
+
+def pending_jobs(jobs: Sequence[Job], output: Path) -> List[Job]:
+    return [job for job in jobs if not _result_path(output, job).exists()]
+
+
+def write_summaries(output: Path, jobs: Sequence[Job]) -> None:
+    rows = []
+    for job in jobs:
+        path = _result_path(output, job)
+        if path.exists():
+            with open(path, "rb") as source:
+                result: ExperimentResult = pickle.load(source)
+            rows.append({"job": job.id, "name": job.name, "seed": job.spec.seed, **result.summary})
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with tempfile.NamedTemporaryFile(
+        "w", dir=output, prefix=TEMPORARY_PREFIX, delete=False, newline=""
+    ) as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(file.name, output / SUMMARIES)
+
+
+def _submit(
+    pool: Executor, job: Job, cache: ResultCache | None, telemetry: Telemetry | None
+) -> "Future[Any]":
+    if telemetry is None:
+        return pool.submit(run_experiment, job.spec, cache)
+    telemetry.experiment_started()
+    directory = None if telemetry.directory is None else str(telemetry.directory)
+    return pool.submit(run_measured, job.spec, cache, directory, telemetry.interval)
+
+
+def _run_jobs(
+    jobs: Sequence[Job],
+    output: Path,
+    workers: int | None,
+    cache: ResultCache | None,
+    telemetry: Telemetry | None = None,
+) -> List[str]:
+    failed = []
+    if telemetry is not None:
+        telemetry.queue(len(jobs))
+    with worker_pool(max_workers=workers) as pool:
+        futures: Dict["Future[Any]", Job] = {
+            _submit(pool, job, cache, telemetry): job for job in jobs
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    write_result(output, job, measured_result(future.result(), telemetry))
+                except Exception:
+                    failed.append(job.id)
+                    print(f"[{done}/{len(jobs)}] {job.id} failed", file=sys.stderr)
+                    traceback.print_exc()
+                else:
+                    print(f"[{done}/{len(jobs)}] {job.id} done")
+        except KeyboardInterrupt:
+            # Completed results are already on disk, the rest runs on restart
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    return failed
+
+
+def run_batch(
+    manifest: Dict[str, Any],
+    output: str | Path,
+    workers: int | None = None,
+    cache: ResultCache | None = None,
+    telemetry: Telemetry | None = None,
+) -> List[str]:
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    for stale in output.glob(f"{TEMPORARY_PREFIX}*"):
+        stale.unlink()
+
+    jobs = jobs_from(manifest)
+    pending = pending_jobs(jobs, output)
+    print(f"{len(jobs) - len(pending)} of {len(jobs)} jobs already completed in {output}")
+    failed = _run_jobs(pending, output, workers, cache, telemetry) if pending else []
+    write_summaries(output, jobs)
+    if telemetry is not None:
+        telemetry.close()
+    return failed
+
+
+def main(arguments: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.batch",
+        description="Runs the experiments of a manifest, skipping the ones already on disk.",
+    )
+    parser.add_argument("manifest", help="JSON file with the experiments to run")
+    parser.add_argument("--output", help="results directory (defaults to the manifest's)")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to all CPUs)")
+    parser.add_argument("--cache", help="optional directory to cache results across batches")
+    parser.add_argument(
+        "--metrics",
+        help="progress file in Prometheus' text format, rewritten every few seconds "
+        "(workers write theirs next to it)",
+    )
+    options = parser.parse_args(arguments)
+
+    manifest = load_manifest(options.manifest)
+    output = options.output or manifest.get("output")
+    if output is None:
+        parser.error("an --output directory is required when the manifest has none")
+    cache = ResultCache(options.cache) if options.cache else None
+    telemetry = Telemetry(path=options.metrics) if options.metrics else None
+    failed = run_batch(manifest, output, workers=options.workers, cache=cache, telemetry=telemetry)
+    if failed:
+        print(f"{len(failed)} jobs failed, run the batch again to retry them", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
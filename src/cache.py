@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import numpy as np
+from simulab.simulation.core.lattice import Lattice
+
+SOURCE_DIRECTORY = Path(__file__).parent
+
+
+def _canonical(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): _canonical(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(each) for each in value]
+    if isinstance(value, Lattice):
+        return _canonical(value.configuration)
+    if isinstance(value, np.ndarray):
+        return _canonical(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "__dict__"):
+        # Agents and formulas are identified by their full state
+        return {"__type__": type(value).__name__, **_canonical(vars(value))}
+    raise TypeError(f"Can not build a stable hash for {type(value).__name__} values.")
+
+
+def stable_hash(value: Any) -> str:
+    canonical = json.dumps(_canonical(value), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def source_version() -> str:
+    digest = hashlib.sha256()
+    for path in sorted(SOURCE_DIRECTORY.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    SUFFIX = ".pickle"
+    TEMPORARY_PREFIX = ".tmp-"
+    STALE_TEMPORARY_SECONDS = 3600
+
+    def __init__(self, directory: str | Path, max_bytes: int = 1 << 30) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return "{}(directory={}, max_bytes={})".format(
+            type(self).__name__,
+            self.directory,
+            self.max_bytes,
+        )
+
+    def _path_for(self, key: str) -> Path:
+        return self.directory / f"{key}{self.SUFFIX}"
+
+    def get(self, key: str) -> Any | None:
+        path = self._path_for(key)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+            # The modification time keeps track of the last use
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            # Missing, or evicted by another process while reading it
+            return None
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        # Entries are written aside and atomically renamed, so concurrent
+        # readers see either the whole entry or nothing.
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory,
+            prefix=self.TEMPORARY_PREFIX,
+            delete=False,
+        ) as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, self._path_for(key))
+        self.evict()
+
+    def __entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        now = time.time()
+        for path in self.directory.iterdir():
+            try:
+                stat = path.stat()
+                if path.name.startswith(self.TEMPORARY_PREFIX):
+                    if now - stat.st_mtime > self.STALE_TEMPORARY_SECONDS:
+                        path.unlink()
+                elif path.suffix == self.SUFFIX:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.__entries())
+
+    def evict(self) -> None:
+        entries = sorted(self.__entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            total = total - size
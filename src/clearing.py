@@ -0,0 +1,111 @@
+from typing import Any, Callable, List, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+Position = Tuple[int, int]
+
+
+class MarketClearing:
+    def __init__(
+        self,
+        consumers: List[Position],
+        producers: List[Position],
+        neighbors_of: Callable[[int, int], List[Position]],
+    ) -> None:
+        self.consumers = consumers
+        self.producers = producers
+        # Lattice coordinates of the consumers, to index per cell arrays
+        self.rows = np.array([i for i, _ in consumers], dtype=np.int64)
+        self.columns = np.array([j for _, j in consumers], dtype=np.int64)
+        index = {position: k for k, position in enumerate(producers)}
+        candidates = [
+            [index[position] for position in neighbors_of(*consumer) if position in index]
+            for consumer in consumers
+        ]
+        # Each row keeps the consumer's sellers in neighborhood order, padded with -1
+        width = max((len(row) for row in candidates), default=0)
+        self.candidates = np.full((len(consumers), max(width, 1)), -1, dtype=np.int64)
+        for k, row in enumerate(candidates):
+            self.candidates[k, : len(row)] = row
+
+    def __repr__(self) -> str:
+        return "{}(consumers={}, producers={})".format(
+            type(self).__name__,
+            len(self.consumers),
+            len(self.producers),
+        )
+
+    def clear(
+        self,
+        prices: NDArray[Any],
+        stocks: NDArray[Any],
+        available: NDArray[Any],
+        quantity_to_buy: Tuple[float, float],
+        standard_normals: NDArray[Any] | None = None,
+    ) -> Tuple[NDArray[Any], NDArray[Any]]:
+        padding = self.candidates < 0
+        offers = np.where(
+            padding | ~available[self.candidates],
+            np.inf,
+            prices[self.candidates],
+        )
+        # A stable sort keeps the neighborhood order between equal prices, as
+        # Consumer.buy does.
+        ranking = np.argsort(offers, axis=1, kind="stable")
+        ranked = np.take_along_axis(self.candidates, ranking, axis=1)
+        valid = np.isfinite(np.take_along_axis(offers, ranking, axis=1))
+
+        # Amounts are drawn in consumer order and only for consumers with
+        # sellers, as the one-by-one purchases do, unless each consumer
+        # already has its own standard normal.
+        amounts = np.zeros(len(self.consumers))
+        buying = valid[:, 0]
+        if standard_normals is None:
+            amounts[buying] = np.random.normal(*quantity_to_buy, size=int(buying.sum()))
+        else:
+            mean, deviation = quantity_to_buy
+            amounts[buying] = mean + deviation * standard_normals[buying]
+
+        rank = np.zeros(len(self.consumers), dtype=np.int64)
+        assignment = np.full(len(self.consumers), -1, dtype=np.int64)
+        remaining = stocks.astype(float)
+        pending = np.flatnonzero(buying)
+        while pending.size:
+            choice = ranked[pending, rank[pending]]
+            demand = np.bincount(choice, weights=amounts[pending], minlength=len(self.producers))
+            accepted = ~(demand > remaining)[choice]
+            if not accepted.all():
+                # Oversold producers serve their orders in consumer order while
+                # their stock lasts, the rest go to the next cheapest seller.
+                oversold = np.flatnonzero(~accepted)
+                order = oversold[np.argsort(choice[oversold], kind="stable")]
+                sellers = choice[order]
+                served = np.cumsum(amounts[pending[order]])
+                starts = np.flatnonzero(np.r_[True, sellers[1:] != sellers[:-1]])
+                served = served - np.repeat(
+                    np.r_[0, served[starts[1:] - 1]],
+                    np.diff(np.r_[starts, sellers.size]),
+                )
+                accepted[order] = served <= remaining[sellers]
+
+            served_consumers = pending[accepted]
+            assignment[served_consumers] = choice[accepted]
+            remaining = remaining - np.bincount(
+                choice[accepted],
+                weights=amounts[served_consumers],
+                minlength=len(self.producers),
+            )
+
+            rejected = pending[~accepted]
+            rank[rejected] += 1
+            has_next = rank[rejected] < ranked.shape[1]
+            rejected = rejected[has_next]
+            pending = rejected[valid[rejected, rank[rejected]]]
+
+        sold = np.bincount(
+            assignment[assignment >= 0],
+            weights=amounts[assignment >= 0],
+            minlength=len(self.producers),
+        )
+        return sold, assignment
@@ -0,0 +1,113 @@
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+from simulab.simulation.core.lattice import Lattice
+
+from src.consumer import Consumer
+from src.producer import Producer
+
+Array = NDArray[Any]
+
+# What each draw is for, each with its own stream
+LAYOUT = 0
+MARGINAL_COST = 1
+PRICE_RATIO = 2
+FIXED_COST = 3
+INITIAL_FACTOR = 4
+QUANTITY = 5
+
+
+class CommonRandomNumbers:
+    # Random numbers tied to what they are for, to a cell and to a step,
+    # instead of to the order in which a run consumes them. Runs sharing a
+    # seed then get the same producer costs, initial factors and quantities
+    # wherever they have the same agents, even when their parameters differ,
+    # and differences between them come from the parameters only. The
+    # antithetic run of a seed keeps the producers in place and uses 1 - u
+    # for every other uniform u and -z for every standard normal z.
+    def __init__(self, seed: int, length: int, antithetic: bool = False) -> None:
+        self.seed = seed
+        self.length = length
+        self.antithetic = antithetic
+        self.__draws: Dict[Tuple[str, int, int], Array] = {}
+
+    def __repr__(self) -> str:
+        return "{}(seed={}, length={}, antithetic={})".format(
+            type(self).__name__,
+            self.seed,
+            self.length,
+            self.antithetic,
+        )
+
+    def __lattice(self, kind: str, purpose: int, step: int) -> Array:
+        key = (kind, purpose, step)
+        if key not in self.__draws:
+            if purpose == QUANTITY:
+                # Only the current step is needed again
+                self.__draws = {
+                    other: draws for other, draws in self.__draws.items() if other[1] != QUANTITY
+                }
+            rng = np.random.default_rng([self.seed, purpose, step])
+            shape = (self.length, self.length)
+            mirrored = self.antithetic and purpose != LAYOUT
+            if kind == "uniform":
+                draws = rng.random(shape)
+                self.__draws[key] = 1 - draws if mirrored else draws
+            else:
+                draws = rng.standard_normal(shape)
+                self.__draws[key] = -draws if mirrored else draws
+        return self.__draws[key]
+
+    def uniforms(self, purpose: int, step: int = 0) -> Array:
+        return self.__lattice("uniform", purpose, step)
+
+    def normals(self, purpose: int, step: int = 0) -> Array:
+        return self.__lattice("normal", purpose, step)
+
+    def uniform(self, purpose: int, i: int, j: int, low: float, high: float) -> float:
+        return float(low + (high - low) * self.uniforms(purpose)[i, j])
+
+    def normal(
+        self, purpose: int, i: int, j: int, mean: float, deviation: float, step: int = 0
+    ) -> float:
+        return float(mean + deviation * self.normals(purpose, step)[i, j])
+
+    def layout(self, producer_probability: float) -> Lattice:
+        # As Lattice.with_probability, producers are int(length² p) cells:
+        # those with the lowest uniforms, so a higher probability keeps the
+        # producers of a lower one and adds some.
+        cells = self.length * self.length
+        producers = np.argsort(self.uniforms(LAYOUT), axis=None, kind="stable")[
+            : int(cells * producer_probability)
+        ]
+        types = np.full(cells, Consumer.TYPE)
+        types[producers] = Producer.TYPE
+        return Lattice(types.reshape(self.length, self.length))
+
+    def initial_factor(self, i: int, j: int) -> int:
+        return 1 if self.uniforms(INITIAL_FACTOR)[i, j] >= 0.5 else -1
+
+    def producer(
+        self,
+        i: int,
+        j: int,
+        capital: float,
+        stock: int,
+        price_ratio: Tuple[float, float],
+        fixed_cost: Tuple[float, float],
+        marginal_cost: Tuple[float, float],
+        profit_period: int,
+    ) -> Producer:
+        # The producer of cell (i, j), the same for Market(crn_seed=...) and
+        # bankrupt_utils.create_configuration(crn_seed=...)
+        cost = abs(self.normal(MARGINAL_COST, i, j, *marginal_cost))
+        return Producer(
+            capital=capital,
+            stock=stock,
+            price=cost * self.uniform(PRICE_RATIO, i, j, *price_ratio),
+            fixed_cost=abs(self.normal(FIXED_COST, i, j, *fixed_cost)),
+            marginal_cost=cost,
+            profit_period=profit_period,
+            initial_factor=self.initial_factor(i, j),
+        )
@@ -15,10 +15,11 @@ class Consumer(Agent):
     def __repr__(self) -> str:
         return f"{type(self).__name__}(price={self.price})"
 
-    def buy(self, amount: int, sellers: List[Producer]) -> None:
+    def buy(self, amount: int, sellers: List[Producer]) -> Producer:
         cheapest = sellers[0]
         for seller in sellers:
             if seller.price < cheapest.price:
                 cheapest = seller
         cheapest.sale(amount)
         self.price = cheapest.price
+        return cheapest
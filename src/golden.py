@@ -0,0 +1,283 @@
+import argparse
+import random
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, NamedTuple, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.runner import Runner
+
+from scenarios.basic_example import config as basic_example_conf
+from scenarios.equilibrio_dinamico import config as equilibrio_dinamico_conf
+from scenarios.monopolios_basic import config as monopolios_basic_conf
+from scenarios.monopolios_complex import config as monopolios_complex_conf
+from src.consumer import Consumer
+from src.market import Market
+from src.producer import Producer
+from src.state_history import DERIVATIONS, StateHistory
+from src.sweep import ExperimentSpec, neighborhood_from
+
+Array = NDArray[Any]
+
+GOLDEN_DIRECTORY = Path(__file__).parent.parent / "tests" / "golden"
+NUMERIC_SERIES = tuple(name for name in DERIVATIONS if not name.endswith("_lattice"))
+# Per cell, on the lattice; producer fields are NaN on consumers
+FIELDS = ("price",) + StateHistory.PRODUCER_FIELDS
+
+
+def _golden(configuration: List[List[int]], **parameters: Any) -> Dict[str, Any]:
+    defaults = dict(
+        length=len(configuration),
+        agent_types=2,
+        configuration=configuration,
+        price_ratio=(1.2, 1.5),
+        fixed_cost=(10, 1),
+        marginal_cost=(10, 1),
+        quantity_to_buy=(1, 0),
+        profit_period=7,
+    )
+    return {**defaults, **parameters}
+
+
+# The notebook's scenarios, with fewer steps
+GOLDEN_SCENARIOS: Dict[str, ExperimentSpec] = {
+    "basic_example": ExperimentSpec(
+        parameters=_golden(basic_example_conf, capital=2500),
+        neighborhood="ExpandedMoore(3)",
+        seed=2000,
+        max_steps=60,
+    ),
+    "monopolios_basic": ExperimentSpec(
+        parameters=_golden(
+            monopolios_basic_conf,
+            profit_period=2,
+            price_ratio=(1.2, 5),
+            fixed_cost=(20, 0),
+        ),
+        neighborhood="Moore",
+        seed=12345,
+        max_steps=60,
+    ),
+    "monopolios_complex": ExperimentSpec(
+        parameters=_golden(monopolios_complex_conf, profit_period=2, fixed_cost=(20, 0)),
+        neighborhood="ExpandedMoore(3)",
+        seed=1234,
+        max_steps=60,
+    ),
+    "equilibrio_dinamico": ExperimentSpec(
+        parameters=_golden(
+            equilibrio_dinamico_conf,
+            capital=30,
+            profit_period=2,
+            price_ratio=(1.3, 1.5),
+            fixed_cost=(7, 0),
+            quantity_to_buy=(1, 0.5),
+            bankrupt_enabled=True,
+        ),
+        neighborhood="ExpandedMoore(2)",
+        seed=6,
+        max_steps=60,
+    ),
+}
+
+
+class Trace(NamedTuple):
+    # (steps x length x length) per field, and (steps,) per numeric series
+    fields: Dict[str, Array]
+    series: Dict[str, Array]
+
+    def save(self, path: str | Path) -> None:
+        np.savez_compressed(
+            path,
+            **{f"field/{name}": values for name, values in self.fields.items()},
+            **{f"series/{name}": values for name, values in self.series.items()},
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Trace":
+        with np.load(path) as arrays:
+            kinds: Dict[str, Dict[str, Array]] = {"field": {}, "series": {}}
+            for key in arrays.files:
+                kind, name = key.split("/", 1)
+                kinds[kind][name] = arrays[key]
+        return cls(fields=kinds["field"], series=kinds["series"])
+
+
+class Divergence(NamedTuple):
+    step: int
+    field: str
+    cell: Tuple[int, int] | None
+    expected: float
+    actual: float
+
+    def __str__(self) -> str:
+        where = "" if self.cell is None else f" at cell {self.cell}"
+        return (
+            f"{self.field} diverges at step {self.step}{where}: "
+            f"expected {self.expected!r}, got {self.actual!r}"
+        )
+
+
+class TracedMarket(Market):
+    # Records the state of every cell after each step, whatever the engine
+    # options are.
+    def run_step(self) -> None:
+        if not hasattr(self, "trace_history"):
+            self.trace_history = StateHistory(
+                length=self.length,
+                producers=sorted(self._by_type[Producer.TYPE]),
+                consumers=sorted(self._by_type[Consumer.TYPE]),
+            )
+            self.trace_history.record(self.configuration)
+        super().run_step()
+        self.trace_history.record(self.configuration)
+
+
+def trace_of(history: StateHistory, series: Mapping[str, Sequence[float]]) -> Trace:
+    shape = (len(history), history.length, history.length)
+    fields = {
+        name: (
+            history.stacked(name)
+            if name == "price"
+            else history.on_lattice(history.stacked(name).astype(float))
+        ).reshape(shape)
+        for name in FIELDS
+    }
+    return Trace(
+        fields=fields,
+        series={name: np.array(series[name], dtype=float) for name in NUMERIC_SERIES},
+    )
+
+
+def record_trace(spec: ExperimentSpec, **modes: Any) -> Trace:
+    if spec.seed is not None:
+        random.seed(spec.seed)
+        np.random.seed(spec.seed)
+    parameters = ExperimentParametersSet(
+        **{name: [value] for name, value in {**spec.parameters, **modes}.items()},
+        neighborhood=[neighborhood_from(spec.neighborhood)],
+    )
+    runner = Runner(TracedMarket, parameters, WithoutCriterion(), max_steps=spec.max_steps)
+    runner.start()
+    experiment: TracedMarket = runner.experiments[0]
+    return trace_of(experiment.trace_history, experiment.series)
+
+
+def _mismatches(expected: Array, actual: Array, rtol: float, atol: float) -> Array:
+    # (steps x cells), where NaN only matches NaN
+    if rtol == 0 and atol == 0:
+        close = (actual == expected) | (np.isnan(actual) & np.isnan(expected))
+    else:
+        close = np.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True)
+    return ~close.reshape(len(expected), -1)
+
+
+def compare(
+    expected: Trace, actual: Trace, rtol: float = 0.0, atol: float = 0.0
+) -> Divergence | None:
+    # Returns the first difference, in step order and then in the order of
+    # the fields and series. No tolerance means bit for bit equality.
+    compared = [
+        (name, values, actual.fields.get(name), True) for name, values in expected.fields.items()
+    ] + [(name, values, actual.series.get(name), False) for name, values in expected.series.items()]
+    first: Tuple[int, int, Divergence] | None = None
+    for order, (name, expected_values, actual_values, on_lattice) in enumerate(compared):
+        if actual_values is None:
+            divergence = Divergence(0, f"{name} (missing)", None, np.nan, np.nan)
+        else:
+            steps = min(len(expected_values), len(actual_values))
+            mismatches = _mismatches(expected_values[:steps], actual_values[:steps], rtol, atol)
+            rows = np.flatnonzero(mismatches.any(axis=1))
+            if rows.size:
+                step = int(rows[0])
+                index = int(np.argmax(mismatches[step]))
+                divergence = Divergence(
+                    step,
+                    name,
+                    divmod(index, expected_values.shape[2]) if on_lattice else None,
+                    float(expected_values[step].ravel()[index]),
+                    float(actual_values[step].ravel()[index]),
+                )
+            elif len(expected_values) != len(actual_values):
+                divergence = Divergence(
+                    steps,
+                    f"{name} (steps)",
+                    None,
+                    len(expected_values),
+                    len(actual_values),
+                )
+            else:
+                continue
+        if first is None or (divergence.step, order) < first[:2]:
+            first = (divergence.step, order, divergence)
+    return None if first is None else first[2]
+
+
+def record_golden(directory: str | Path = GOLDEN_DIRECTORY) -> List[Path]:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, spec in GOLDEN_SCENARIOS.items():
+        path = directory / f"{name}.npz"
+        record_trace(spec).save(path)
+        paths.append(path)
+    return paths
+
+
+def check_golden(
+    directory: str | Path = GOLDEN_DIRECTORY,
+    rtol: float = 0.0,
+    atol: float = 0.0,
+    **modes: Any,
+) -> Dict[str, Divergence | None]:
+    return {
+        name: compare(
+            Trace.load(Path(directory) / f"{name}.npz"),
+            record_trace(spec, **modes),
+            rtol=rtol,
+            atol=atol,
+        )
+        for name, spec in GOLDEN_SCENARIOS.items()
+    }
+
+
+def _mode(option: str) -> Tuple[str, Any]:
+    name, _, value = option.partition("=")
+    flags: Dict[str, Any] = {"true": True, "false": False}
+    return name, True if not value else flags.get(value, value)
+
+
+def main(arguments: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.golden",
+        description="Records the golden traces of the scenarios, or replays them.",
+    )
+    parser.add_argument("command", choices=["record", "check"])
+    parser.add_argument("--directory", default=str(GOLDEN_DIRECTORY))
+    parser.add_argument("--rtol", type=float, default=0.0)
+    parser.add_argument("--atol", type=float, default=0.0)
+    parser.add_argument(
+        "--mode",
+        action="append",
+        default=[],
+        help="Market option to replay with, e.g. batched_clearing or resync_every=7",
+    )
+    options = parser.parse_args(arguments)
+
+    if options.command == "record":
+        for path in record_golden(options.directory):
+            print(f"recorded {path}")
+        return 0
+    modes = dict(_mode(option) for option in options.mode)
+    modes = {name: int(value) if str(value).isdigit() else value for name, value in modes.items()}
+    divergences = check_golden(options.directory, options.rtol, options.atol, **modes)
+    for name, divergence in divergences.items():
+        print(f"{name}: {'ok' if divergence is None else divergence}")
+    return 0 if all(divergence is None for divergence in divergences.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import argparse
+import os
+import pickle
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+from src.batch import (
+    Job,
+    jobs_from,
+    load_manifest,
+    write_result,
+    write_summaries,
+)
+from src.sweep import ExperimentResult, ExperimentSpec, run_experiment
+from src.telemetry import Telemetry, install
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    spec BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT,
+    result BLOB,
+    submitted_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, lease_until);
+"""
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ClaimedJob(NamedTuple):
+    id: str
+    name: str
+    spec: ExperimentSpec
+    attempts: int
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobQueue:
+    # Jobs live in a SQLite database, so any number of processes (on this
+    # host, or on others sharing the file) can drain the same queue. A claim
+    # is a lease: a worker that dies without finishing lets it expire, and
+    # the job is claimed again until it runs out of attempts.
+    def __init__(
+        self,
+        path: str | Path,
+        lease_seconds: float = 600,
+        max_attempts: int = 3,
+        timeout: float = 60,
+    ) -> None:
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        with self.__connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def __repr__(self) -> str:
+        return "{}(path={}, lease_seconds={}, max_attempts={})".format(
+            type(self).__name__,
+            self.path,
+            self.lease_seconds,
+            self.max_attempts,
+        )
+
+    @contextmanager
+    def __connection(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def __transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front, so reading the next
+        # job and marking it as claimed happen atomically across processes.
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def submit(self, jobs: Iterable[Job]) -> int:
+        now = time.time()
+        with self.__transaction() as connection:
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO jobs (id, name, spec, submitted_at) VALUES (?, ?, ?, ?)",
+                [(job.id, job.name, pickle.dumps(job.spec), now) for job in jobs],
+            )
+            return cursor.rowcount
+
+    def claim(self, worker: str) -> ClaimedJob | None:
+        now = time.time()
+        with self.__transaction() as connection:
+            # Leases of dead workers that already used every attempt are not
+            # claimed again.
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, "
+                "error = coalesce(error, 'Lease expired on every attempt') "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts),
+            )
+            row = connection.execute(
+                "SELECT id, name, spec, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY submitted_at, id LIMIT 1",
+                (PENDING, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            identifier, name, spec, attempts = row
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = ? "
+                "WHERE id = ?",
+                (RUNNING, worker, now + self.lease_seconds, attempts + 1, identifier),
+            )
+        return ClaimedJob(identifier, name, pickle.loads(spec), attempts + 1)
+
+    def renew(self, job: ClaimedJob, worker: str) -> bool:
+        with self.__transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ? AND worker = ?",
+                (time.time() + self.lease_seconds, job.id, RUNNING, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job: ClaimedJob, worker: str, result: ExperimentResult) -> bool:
+        # A worker whose lease expired may still finish: its result is kept
+        # unless another worker already registered one.
+        with self.__transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, result = ?, error = NULL, "
+                "lease_until = NULL, finished_at = ? WHERE id = ? AND status != ?",
+                (DONE, worker, pickle.dumps(result), time.time(), job.id, DONE),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job: ClaimedJob, worker: str, error: str) -> None:
+        with self.__transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_until = NULL, "
+                "finished_at = CASE WHEN attempts >= ? THEN ? END "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (
+                    self.max_attempts,
+                    FAILED,
+                    PENDING,
+                    error,
+                    self.max_attempts,
+                    time.time(),
+                    job.id,
+                    RUNNING,
+                    worker,
+                ),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self.__connection() as connection:
+            rows = connection.execute("SELECT status, count(*) FROM jobs GROUP BY status")
+            return {status: 0 for status in (PENDING, RUNNING, DONE, FAILED)} | dict(rows)
+
+    def results(self) -> Iterator[Tuple[Job, ExperimentResult]]:
+        with self.__connection() as connection:
+            rows = connection.execute(
+                "SELECT id, name, spec, result FROM jobs WHERE status = ? "
+                "ORDER BY submitted_at, id",
+                (DONE,),
+            )
+            for identifier, name, spec, result in rows:
+                yield Job(identifier, name, pickle.loads(spec)), pickle.loads(result)
+
+    def failures(self) -> List[Tuple[str, int, str]]:
+        with self.__connection() as connection:
+            rows = connection.execute(
+                "SELECT id, attempts, error FROM jobs WHERE status = ? ORDER BY id", (FAILED,)
+            )
+            return list(rows)
+
+
+def work(
+    path: str | Path,
+    worker: str | None = None,
+    lease_seconds: float = 600,
+    max_attempts: int = 3,
+    max_jobs: int | None = None,
+    telemetry: Telemetry | None = None,
+) -> int:
+    queue = JobQueue(path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    name = worker or default_worker_id()
+    completed = 0
+    if telemetry is not None:
+        # The experiments of this worker report their steps to it
+        install(telemetry)
+    while max_jobs is None or completed < max_jobs:
+        job = queue.claim(name)
+        if job is None:
+            break
+        # The lease is renewed while the experiment runs, so only dead
+        # workers lose their jobs.
+        finished = threading.Event()
+
+        def renew(job: ClaimedJob) -> None:
+            while not finished.wait(lease_seconds / 3):
+                queue.renew(job, name)
+
+        renewal = threading.Thread(target=renew, args=(job,), daemon=True)
+        renewal.start()
+        try:
+            result = run_experiment(job.spec)
+        except Exception:
+            queue.fail(job, name, traceback.format_exc())
+        else:
+            # False when the lease expired and another worker stored its
+            # result first: that job counts for the other worker
+            if queue.complete(job, name, result):
+                completed += 1
+        finally:
+            finished.set()
+            renewal.join()
+            if telemetry is not None:
+                telemetry.experiments_queued = queue.counts()[PENDING]
+    if telemetry is not None:
+        telemetry.close()
+        install(None)
+    return completed
+
+
+def export(queue: JobQueue, output: str | Path) -> int:
+    # Writes the finished jobs as a batch results directory (see src.batch)
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for job, result in queue.results():
+        write_result(output, job, result)
+        jobs.append(job)
+    write_summaries(output, jobs)
+    return len(jobs)
+
+
+def main(arguments: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.job_queue",
+        description="Shares the experiments of a manifest between workers through a SQLite queue.",
+    )
+    parser.add_argument("--queue", required=True, help="SQLite file holding the queue")
+    parser.add_argument("--lease", type=float, default=600, help="seconds before a claim expires")
+    parser.add_argument("--attempts", type=int, default=3, help="attempts before giving up a job")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="add the jobs of a manifest to the queue")
+    submit.add_argument("manifest")
+    worker = commands.add_parser("work", help="run jobs until the queue is drained")
+    worker.add_argument("--worker", help="worker name (defaults to host and process id)")
+    worker.add_argument("--metrics", help="progress file in Prometheus' text format")
+    commands.add_parser("status", help="count the jobs by status")
+    exported = commands.add_parser("export", help="write the results as a batch output")
+    exported.add_argument("output")
+    options = parser.parse_args(arguments)
+
+    queue = JobQueue(options.queue, lease_seconds=options.lease, max_attempts=options.attempts)
+    if options.command == "submit":
+        jobs = jobs_from(load_manifest(options.manifest))
+        print(f"{queue.submit(jobs)} of {len(jobs)} jobs added to {options.queue}")
+    elif options.command == "work":
+        telemetry = (
+            Telemetry(path=options.metrics, worker=options.worker) if options.metrics else None
+        )
+        done = work(
+            options.queue, options.worker, options.lease, options.attempts, telemetry=telemetry
+        )
+        print(f"{done} jobs completed")
+    elif options.command == "status":
+        print(" ".join(f"{status}={count}" for status, count in queue.counts().items()))
+        for identifier, attempts, error in queue.failures():
+            last_line = error.strip().splitlines()[-1] if error else ""
+            print(f"{identifier} failed after {attempts} attempts: {last_line}", file=sys.stderr)
+    else:
+        print(f"{export(queue, options.output)} results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
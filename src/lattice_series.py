@@ -0,0 +1,156 @@
+from collections.abc import Sequence
+from typing import Any, Iterable, List, NamedTuple, Tuple, overload
+
+import numpy as np
+from numpy.typing import NDArray
+
+Array = NDArray[Any]
+
+
+class Keyframe(NamedTuple):
+    values: Array
+    categories: Array | None
+
+
+class LatticeDiff(NamedTuple):
+    cells: Array
+    values: Array
+    categories: Array | None
+
+
+def _changed(previous: Array, current: Array) -> Array:
+    changed = previous != current
+    if previous.dtype.kind == "f":
+        # NaN marks dead producers and empty cells, it is not a change by itself
+        changed &= ~(np.isnan(previous) & np.isnan(current))
+    return changed
+
+
+class DeltaLatticeSeries(Sequence[List[List[Any]]]):
+    # Every `keyframe_every` steps the whole lattice is kept, and the steps in
+    # between only keep the cells that changed since the previous step. Any
+    # step is rebuilt from its keyframe with at most `keyframe_every - 1`
+    # diffs, and walking the series forward applies one diff per step.
+    def __init__(
+        self,
+        lattices: Iterable[List[List[Any]]] = (),
+        keyframe_every: int = 32,
+    ) -> None:
+        assert keyframe_every >= 1, "Keyframes should be taken every one step or more."
+        self.keyframe_every = keyframe_every
+        self.shape: Tuple[int, ...] = ()
+        self.categorized = False
+        self.__keyframes: List[Keyframe] = []
+        self.__diffs: List[LatticeDiff | None] = []
+        self.__last: Keyframe | None = None
+        self.__cursor: Tuple[int, Keyframe] | None = None
+        for lattice in lattices:
+            self.append(lattice)
+
+    def __repr__(self) -> str:
+        return "{}(steps={}, keyframes={}, nbytes={})".format(
+            type(self).__name__,
+            len(self),
+            len(self.__keyframes),
+            self.nbytes,
+        )
+
+    def __len__(self) -> int:
+        return len(self.__diffs)
+
+    @property
+    def nbytes(self) -> int:
+        # Keyframes share their categories while they do not change
+        arrays = {
+            id(array): array.nbytes
+            for part in (*self.__keyframes, *filter(None, self.__diffs))
+            for array in part
+            if array is not None
+        }
+        return sum(arrays.values())
+
+    def __split(self, lattice: List[List[Any]]) -> Keyframe:
+        if not self.__diffs:
+            first = lattice[0][0] if lattice and lattice[0] else None
+            self.categorized = isinstance(first, tuple)
+            self.shape = (len(lattice), len(lattice[0]) if lattice else 0)
+        if not self.categorized:
+            return Keyframe(np.array(lattice).ravel(), None)
+        values = np.array([value for row in lattice for value, _ in row])
+        categories = np.array([category for row in lattice for _, category in row])
+        return Keyframe(values, categories)
+
+    def append(self, lattice: List[List[Any]]) -> None:
+        current = self.__split(lattice)
+        last = self.__last
+        if last is None or len(self) % self.keyframe_every == 0:
+            if (
+                last is not None
+                and current.categories is not None
+                and last.categories is not None
+                and np.array_equal(last.categories, current.categories)
+            ):
+                current = current._replace(categories=self.__keyframes[-1].categories)
+            self.__keyframes.append(current)
+            self.__diffs.append(None)
+        else:
+            changed = _changed(last.values, current.values)
+            if current.categories is not None:
+                recategorized = last.categories != current.categories
+                changed |= recategorized
+            cells = np.flatnonzero(changed).astype(np.int32)
+            self.__diffs.append(
+                LatticeDiff(
+                    cells,
+                    current.values[cells],
+                    # Categories are only kept for the steps that change them
+                    (
+                        current.categories[cells]
+                        if current.categories is not None and recategorized.any()
+                        else None
+                    ),
+                )
+            )
+        self.__last = current
+
+    def __state_at(self, step: int) -> Keyframe:
+        start = step - step % self.keyframe_every
+        cursor = self.__cursor
+        if cursor is not None and start <= cursor[0] <= step:
+            position, state = cursor
+        else:
+            keyframe = self.__keyframes[step // self.keyframe_every]
+            position = start
+            state = Keyframe(
+                keyframe.values.copy(),
+                None if keyframe.categories is None else keyframe.categories.copy(),
+            )
+        for diff in self.__diffs[position + 1 : step + 1]:
+            assert diff is not None
+            state.values[diff.cells] = diff.values
+            if diff.categories is not None:
+                assert state.categories is not None
+                state.categories[diff.cells] = diff.categories
+        self.__cursor = (step, state)
+        return state
+
+    def arrays(self, step: int) -> Tuple[Array, Array | None]:
+        state = self.__state_at(range(len(self))[step])
+        return (
+            state.values.reshape(self.shape).copy(),
+            None if state.categories is None else state.categories.reshape(self.shape).copy(),
+        )
+
+    @overload
+    def __getitem__(self, step: int) -> List[List[Any]]: ...
+
+    @overload
+    def __getitem__(self, step: slice) -> List[List[List[Any]]]: ...
+
+    def __getitem__(self, step: int | slice) -> Any:
+        if isinstance(step, slice):
+            return [self[each] for each in range(len(self))[step]]
+        values, categories = self.arrays(step)
+        if categories is None:
+            return values.tolist()
+        return [list(zip(*row)) for row in zip(values.tolist(), categories.tolist())]
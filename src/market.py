@@ -1,7 +1,9 @@
+from copy import deepcopy
 from statistics import mean
-from typing import Callable, List, Tuple, cast
+from typing import Any, Callable, List, MutableMapping, Tuple, cast
 
 import numpy as np
+from numpy.typing import NDArray
 from simulab.models.abstract.agent import Agent
 from simulab.models.abstract.model import (
     AbstractLatticeModel,
@@ -10,11 +12,27 @@ from simulab.models.abstract.model import (
 )
 from simulab.simulation.core.lattice import Lattice
 
+from src.aggregates import RunningMean
+from src.bankruptcy import BankruptcyLog
+from src.clearing import MarketClearing
+from src.common_random import QUANTITY, CommonRandomNumbers
 from src.consumer import Consumer
+from src.lattice_series import DeltaLatticeSeries
+from src.market_share import (
+    consumers_per_producer,
+    herfindahl,
+    local_monopolies,
+)
 from src.producer import Producer
+from src.state_history import DerivedSeries, StateHistory
+from src.telemetry import Telemetry, active_telemetry
 
 
 class Market(AbstractLatticeModel):
+    configuration: Lattice
+    # A DerivedSeries with deferred_series
+    series: MutableMapping[str, Any]
+
     def __init__(  # type: ignore[no-untyped-def]
         self,
         capital: float = 1_000_000,
@@ -26,6 +44,16 @@ class Market(AbstractLatticeModel):
         profit_period: int = 5,
         producer_probability: float = 0.1,
         bankrupt_enabled: bool = False,
+        batched_clearing: bool = False,
+        deferred_series: bool = False,
+        incremental_aggregates: bool = False,
+        resync_every: int = 100,
+        check_aggregates: bool = False,
+        compressed_lattices: bool = False,
+        keyframe_every: int = 32,
+        crn_seed: int | None = None,
+        antithetic: bool = False,
+        telemetry: Telemetry | None = None,
         *args,
         **kwargs,
     ):
@@ -38,15 +66,41 @@ class Market(AbstractLatticeModel):
         self.profit_period = profit_period
         self.producer_probability = producer_probability
         self.bankrupt_enabled = bankrupt_enabled
+        self.batched_clearing = batched_clearing
+        self.deferred_series = deferred_series
+        self.incremental_aggregates = incremental_aggregates
+        self.resync_every = resync_every
+        self.check_aggregates = check_aggregates
+        self.compressed_lattices = compressed_lattices
+        self.keyframe_every = keyframe_every
+        self.crn_seed = crn_seed
+        self.antithetic = antithetic
+        # Without one, runs report to the telemetry of the process, if any
+        self.telemetry = telemetry if telemetry is not None else active_telemetry()
+        self.__sorted_series_names: List[str] = []
 
         length = kwargs.get("length")
-        configuration = kwargs.pop(
-            "configuration",
-            Lattice.with_probability(
-                self.producer_probability,
-                cast(int, length),
-            ),
+        # With a crn_seed, draws come from common random numbers instead of
+        # the global numpy stream (see src.common_random)
+        self.random_numbers = (
+            None
+            if crn_seed is None
+            else CommonRandomNumbers(crn_seed, cast(int, length), antithetic=antithetic)
         )
+        if self.random_numbers is None:
+            # Drawn even when a configuration is given, which keeps the
+            # global stream of seeded runs as it always was
+            configuration = kwargs.pop(
+                "configuration",
+                Lattice.with_probability(
+                    self.producer_probability,
+                    cast(int, length),
+                ),
+            )
+        elif "configuration" in kwargs:
+            configuration = kwargs.pop("configuration")
+        else:
+            configuration = self.random_numbers.layout(self.producer_probability)
 
         kwargs["configuration"] = configuration
 
@@ -57,9 +111,172 @@ class Market(AbstractLatticeModel):
             **kwargs,
         )
 
+    @property
+    def _sorted_series_names(self) -> List[str]:
+        # Deferred series are derived from the recorded states instead
+        return [] if self.deferred_series else self.__sorted_series_names
+
+    @_sorted_series_names.setter
+    def _sorted_series_names(self, names: List[str]) -> None:
+        # simulab sorts the series once the agents are in place, at the
+        # beginning of every run.
+        self.__sorted_series_names = names
+        self.__start_run()
+
+    def __start_run(self) -> None:
+        producers = sorted(self._by_type[Producer.TYPE])
+        self.__producers = producers
+        self.__consumers = list(self._by_type[Consumer.TYPE])
+        # Purchases of the last step, see src.market_share
+        self.__producer_ids = {position: k for k, position in enumerate(producers)}
+        self.__consumer_ids = {position: k for k, position in enumerate(self.__consumers)}
+        self.__assignment = np.full(len(self.__consumers), -1, dtype=np.int64)
+        self.__sellers = np.zeros(len(self.__consumers), dtype=np.int64)
+        self.__shares: Tuple[int, NDArray[Any]] | None = None
+        self.bankruptcy_log = BankruptcyLog(producers=len(producers))
+        for position in producers:
+            self.get_agent(*position).report_to(self.bankruptcy_log, position)
+        if self.batched_clearing:
+            self.__clearing = MarketClearing(
+                consumers=self.__consumers,
+                producers=producers,
+                neighbors_of=self.neighborhood.indexes_for,
+            )
+        if self.deferred_series:
+            self.state_history = StateHistory(
+                length=self.length,
+                producers=producers,
+                consumers=sorted(self._by_type[Consumer.TYPE]),
+                bankrupt_enabled=self.bankrupt_enabled,
+            )
+            self.state_history.record(self.configuration)
+            self.series = DerivedSeries(self.state_history, names=self.series)
+        elif self.compressed_lattices:
+            for name in self.series:
+                if name.endswith("_lattice"):
+                    self.series[name] = DeltaLatticeSeries(keyframe_every=self.keyframe_every)
+        if self.incremental_aggregates:
+            self.__aggregates = {
+                name: RunningMean()
+                for name in ("average_consumer_price", "average_producer_price", "average_profit")
+            }
+            self.__resync_aggregates()
+
+    def run_with(self, max_steps: int, *args: Any, **kwargs: Any) -> None:
+        if self.telemetry is None:
+            super().run_with(max_steps, *args, **kwargs)
+            return
+        self.telemetry.experiment_started(max_steps)
+        try:
+            super().run_with(max_steps, *args, **kwargs)
+        finally:
+            self.telemetry.experiment_done()
+
+    def run_step(self) -> None:
+        self.bankruptcy_log.step += 1
+        self.__assignment[:] = -1
+        self.__sellers[:] = 0
+        if self.batched_clearing:
+            configuration = deepcopy(self.configuration)
+            self.__clear_orders(configuration)
+            for i, j in self._by_type[Producer.TYPE]:
+                self.step(i, j, configuration=configuration)
+            self.configuration = configuration
+        else:
+            super(Market, self).run_step()
+        if self.deferred_series:
+            self.state_history.record(self.configuration, self.__assignment, self.__sellers)
+        if self.incremental_aggregates and self.bankruptcy_log.step % self.resync_every == 0:
+            # Bounds the floating point drift of the running sums
+            self.__resync_aggregates()
+        if self.telemetry is not None:
+            self.telemetry.step_done()
+
+    def __clear_orders(self, configuration: Lattice) -> None:
+        clearing = self.__clearing
+        producers = [configuration.at(*position) for position in clearing.producers]
+        prices = np.array([producer.price for producer in producers])
+        available = np.array(
+            [not (self.bankrupt_enabled and producer.bankrupted) for producer in producers],
+            dtype=bool,
+        )
+        sold, assignment = clearing.clear(
+            prices=prices,
+            stocks=np.array([producer.stock for producer in producers], dtype=float),
+            available=available,
+            quantity_to_buy=self.quantity_to_buy,
+            standard_normals=(
+                None
+                if self.random_numbers is None
+                else self.random_numbers.normals(QUANTITY, self.bankruptcy_log.step)[
+                    clearing.rows, clearing.columns
+                ]
+            ),
+        )
+        for producer, amount in zip(producers, sold.tolist()):
+            if amount != 0:
+                producer.sale(amount)
+        self.__assignment[:] = assignment
+        self.__sellers[:] = ((clearing.candidates >= 0) & available[clearing.candidates]).sum(
+            axis=1
+        )
+        for position, seller in zip(clearing.consumers, assignment.tolist()):
+            if seller >= 0:
+                consumer = configuration.at(*position)
+                price = producers[seller].price
+                if self.incremental_aggregates and consumer.price != price:
+                    self.__aggregates["average_consumer_price"].replace(consumer.price, price)
+                consumer.price = price
+
+    def __resync_aggregates(self) -> None:
+        producers = [self.get_agent(*position) for position in self.__producers]
+        self.__aggregates["average_consumer_price"].reset(
+            self.get_agent(*position).price for position in self.__consumers
+        )
+        self.__aggregates["average_producer_price"].reset(producer.price for producer in producers)
+        self.__aggregates["average_profit"].reset(
+            producer.last_profit for producer in producers if not self.__is_bankrupted(producer)
+        )
+
+    def __update_producer_aggregates(
+        self,
+        producer: Producer,
+        price: float,
+        last_profit: float,
+        bankrupted: bool,
+    ) -> None:
+        if producer.price != price:
+            self.__aggregates["average_producer_price"].replace(price, producer.price)
+        if (last_profit, bankrupted) != (producer.last_profit, self.__is_bankrupted(producer)):
+            profits = self.__aggregates["average_profit"]
+            if not bankrupted:
+                profits.remove(last_profit)
+            if not self.__is_bankrupted(producer):
+                profits.add(producer.last_profit)
+
+    def __aggregated(self, name: str, full: Callable[[], float]) -> float:
+        running = self.__aggregates[name]
+        if self.check_aggregates and running.count:
+            expected = full()
+            assert np.isclose(
+                running.value, expected, rtol=1e-9, atol=1e-9
+            ), f"Incremental {name} is {running.value}, {expected} expected."
+        return running.value
+
     def _create_agent(self, basic_agent: Agent, i: int, j: int) -> Agent:
         if basic_agent.agent_type == Consumer.TYPE:
             agent = Consumer()
+        elif basic_agent.agent_type == Producer.TYPE and self.random_numbers is not None:
+            agent = self.random_numbers.producer(
+                i,
+                j,
+                capital=self.capital,
+                stock=self.stock,
+                price_ratio=self.price_ratio,
+                fixed_cost=self.fixed_cost,
+                marginal_cost=self.marginal_cost,
+                profit_period=self.profit_period,
+            )
         elif basic_agent.agent_type == Producer.TYPE:
             marginal_cost = abs(np.random.normal(*self.marginal_cost))
             price_ratio = np.random.uniform(*self.price_ratio)
@@ -104,14 +321,30 @@ class Market(AbstractLatticeModel):
         _type = agent.agent_type
         if _type == Consumer.TYPE:
             sellers = self.__sellers_for(i, j, configuration)
+            consumer_id = self.__consumer_ids[(i, j)]
+            self.__sellers[consumer_id] = len(sellers)
             if sellers:
-                agent.buy(amount=np.random.normal(*self.quantity_to_buy), sellers=sellers)
+                price = agent.price
+                if self.random_numbers is None:
+                    amount = np.random.normal(*self.quantity_to_buy)
+                else:
+                    amount = self.random_numbers.normal(
+                        QUANTITY, i, j, *self.quantity_to_buy, step=self.bankruptcy_log.step
+                    )
+                seller = agent.buy(amount=amount, sellers=sellers)
+                self.__assignment[consumer_id] = self.__producer_ids[seller.position]
+                if self.incremental_aggregates and agent.price != price:
+                    self.__aggregates["average_consumer_price"].replace(price, agent.price)
             else:
                 # Consumer has no Producers in it's neighborhood.
                 pass
         elif _type == Producer.TYPE:
             if self.bankrupt_enabled and agent.bankrupted:
                 pass
+            elif self.incremental_aggregates:
+                before = (agent.price, agent.last_profit, self.__is_bankrupted(agent))
+                agent.balance_check()
+                self.__update_producer_aggregates(agent, *before)
             else:
                 agent.balance_check()
         else:
@@ -236,6 +469,11 @@ class Market(AbstractLatticeModel):
     # Series numericas
     @as_series
     def average_profit(self) -> float:
+        if self.incremental_aggregates:
+            return self.__aggregated("average_profit", self.__average_profit)
+        return self.__average_profit()
+
+    def __average_profit(self) -> float:
         action = lambda i, j: self.__get_last_profit(i, j)
         profits = self._process_lattice_with(action, flatten=True)
         profits = filter(lambda profit: not np.isnan(profit), profits)
@@ -264,6 +502,11 @@ class Market(AbstractLatticeModel):
 
     @as_series
     def average_consumer_price(self) -> float:
+        if self.incremental_aggregates:
+            return self.__aggregated("average_consumer_price", self.__average_consumer_price)
+        return self.__average_consumer_price()
+
+    def __average_consumer_price(self) -> float:
         prices = self._process_lattice_with(
             self.__collect(Consumer.TYPE),
             flatten=True,
@@ -273,6 +516,11 @@ class Market(AbstractLatticeModel):
 
     @as_series
     def average_producer_price(self) -> float:
+        if self.incremental_aggregates:
+            return self.__aggregated("average_producer_price", self.__average_producer_price)
+        return self.__average_producer_price()
+
+    def __average_producer_price(self) -> float:
         prices = self._process_lattice_with(
             self.__collect(Producer.TYPE),
             flatten=True,
@@ -294,15 +542,35 @@ class Market(AbstractLatticeModel):
         # Gini coefficient
         return 0.5 * rmad
 
+    def producer_positions(self) -> List[Tuple[int, int]]:
+        # Producer ids are indexes into this list
+        return list(self.__producers)
+
+    def __consumers_per_producer(self) -> NDArray[Any]:
+        # Shared by the market share series of a step
+        step = self.bankruptcy_log.step
+        if self.__shares is None or self.__shares[0] != step:
+            counts = consumers_per_producer(self.__assignment[None, :], len(self.__producers))
+            self.__shares = (step, counts)
+        return self.__shares[1]
+
     @as_series
-    def alive_producers(self) -> float:
-        count = 0.0
+    def consumers_per_producer(self) -> NDArray[Any]:
+        return self.__consumers_per_producer()[0]
 
-        def count_alive_producers(i: int, j: int) -> None:
-            nonlocal count
-            agent = self.get_agent(i, j)
-            if agent.agent_type == Producer.TYPE and not self.__is_bankrupted(agent):
-                count += 1
+    @as_series
+    def market_share_hhi(self) -> float:
+        return float(herfindahl(self.__consumers_per_producer())[0])
 
-        self._process_lattice_with(lambda i, j: count_alive_producers(i, j))
-        return count
+    @as_series
+    def local_monopolies(self) -> float:
+        monopolies = local_monopolies(
+            self.__assignment[None, :], self.__sellers[None, :], len(self.__producers)
+        )
+        return float(monopolies[0])
+
+    @as_series
+    def alive_producers(self) -> float:
+        if self.bankrupt_enabled:
+            return float(self.bankruptcy_log.alive)
+        return float(self.bankruptcy_log.producers)
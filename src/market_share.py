@@ -0,0 +1,38 @@
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+Array = NDArray[Any]
+
+# Purchases of a step, one entry per consumer: the id of the producer it
+# bought from (its index among the sorted producer positions, -1 when it
+# did not buy), and how many sellers it could choose from.
+
+
+def consumers_per_producer(assignment: Array, producers: int) -> Array:
+    # (steps x producers) from (steps x consumers) assignments, with a single
+    # bincount over every step
+    steps = assignment.shape[0]
+    served = assignment >= 0
+    ids = (assignment + producers * np.arange(steps)[:, None])[served]
+    return np.bincount(ids, minlength=steps * producers).reshape(steps, producers)
+
+
+def herfindahl(consumers: Array) -> Array:
+    # Sum of the squared market shares per step, from 1 / producers (evenly
+    # split) to 1 (a single producer serves everybody). NaN without sales.
+    total = consumers.sum(axis=1)
+    squares = (consumers.astype(float) ** 2).sum(axis=1)
+    return np.divide(
+        squares,
+        total.astype(float) ** 2,
+        out=np.full(total.shape, np.nan),
+        where=total > 0,
+    )
+
+
+def local_monopolies(assignment: Array, sellers: Array, producers: int) -> Array:
+    # Producers per step that are the only seller some consumer can buy from
+    captive = consumers_per_producer(np.where(sellers == 1, assignment, -1), producers)
+    return np.count_nonzero(captive, axis=1)
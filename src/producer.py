@@ -1,5 +1,8 @@
+from typing import Tuple
+
 from simulab.models.abstract.agent import Agent
 
+from src.bankruptcy import BankruptcyLog
 from src.profit_formula import ProfitFormula
 
 
@@ -14,6 +17,7 @@ class Producer(Agent):
         fixed_cost: float,
         marginal_cost: float,
         profit_period: int,
+        initial_factor: int | None = None,
     ) -> None:
         self.capital = capital
         self.stock = stock
@@ -22,9 +26,12 @@ class Producer(Agent):
             fixed_cost=fixed_cost,
             marginal_cost=marginal_cost,
             profit_period=profit_period,
+            initial_factor=initial_factor,
         )
         self.__sales_of_the_day = 0
         self.bankrupted = False
+        self.position: Tuple[int, int] | None = None
+        self.bankruptcy_log: BankruptcyLog | None = None
         super(Producer, self).__init__(self.TYPE)
 
     def __repr__(self) -> str:
@@ -51,6 +58,10 @@ class Producer(Agent):
     def previous_profit(self) -> float:
         return self.profit_formula.previous_profit
 
+    def report_to(self, bankruptcy_log: BankruptcyLog, position: Tuple[int, int]) -> None:
+        self.bankruptcy_log = bankruptcy_log
+        self.position = position
+
     def sale(self, amount: int) -> None:
         if self.stock >= amount:
             self.stock = self.stock - amount
@@ -62,5 +73,9 @@ class Producer(Agent):
         period_finished = self.profit_formula.check(self.__sales_of_the_day)
         if period_finished:
             self.capital = self.capital + self.profit_formula.last_profit
-            self.bankrupted = self.capital <= 0
+            bankrupted = self.capital <= 0
+            if bankrupted != self.bankrupted and self.bankruptcy_log is not None:
+                assert self.position is not None, "report_to() sets the position with the log."
+                self.bankruptcy_log.register(self.position, self.capital, bankrupted)
+            self.bankrupted = bankrupted
         self.__sales_of_the_day = 0
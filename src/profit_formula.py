@@ -9,6 +9,7 @@ class ProfitFormula:
         marginal_cost: float,
         profit_period: int,
         delta_price: float = 0.02,
+        initial_factor: int | None = None,
     ) -> None:
         self.price = price
         self.previous_price = price
@@ -19,7 +20,10 @@ class ProfitFormula:
         self.previous_profit: float = 0
         self.last_profit: float = 0
         self.sales_within_period: int = 0
-        self.__current_factor: int = random.randint(0, 1) * 2 - 1
+        # Whether the first change of price is a rise (1) or a fall (-1)
+        self.__current_factor: int = (
+            random.randint(0, 1) * 2 - 1 if initial_factor is None else initial_factor
+        )
         self.__initial_profit_period: int = profit_period
 
     def __repr__(self) -> str:
@@ -0,0 +1,266 @@
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+from simulab.simulation.core.lattice import Lattice
+
+from src.market_share import (
+    consumers_per_producer,
+    herfindahl,
+    local_monopolies,
+)
+
+Position = Tuple[int, int]
+Array = NDArray[Any]
+
+
+class StateHistory:
+    PRODUCER_FIELDS = ("previous_price", "last_profit", "previous_profit", "capital", "bankrupted")
+    # One per consumer (see src.market_share)
+    PURCHASE_FIELDS = ("assignment", "sellers")
+
+    def __init__(
+        self,
+        length: int,
+        producers: List[Position],
+        consumers: List[Position],
+        bankrupt_enabled: bool = False,
+    ) -> None:
+        self.length = length
+        self.producers = producers
+        self.consumers = consumers
+        self.bankrupt_enabled = bankrupt_enabled
+        self.producer_cells = np.array([i * length + j for i, j in producers], dtype=np.int64)
+        self.consumer_cells = np.array([i * length + j for i, j in consumers], dtype=np.int64)
+        self.agent_types = np.zeros(length * length, dtype=np.int64)
+        self.agent_types[self.producer_cells] = 1
+        self.__records: Dict[str, List[Array]] = {
+            field: [] for field in ("price",) + self.PRODUCER_FIELDS + self.PURCHASE_FIELDS
+        }
+        self.__stacked: Dict[str, Tuple[int, Array]] = {}
+
+    def __repr__(self) -> str:
+        return "{}(length={}, producers={}, steps={})".format(
+            type(self).__name__,
+            self.length,
+            len(self.producers),
+            len(self),
+        )
+
+    def __len__(self) -> int:
+        return len(self.__records["price"])
+
+    def record(
+        self,
+        configuration: Lattice,
+        assignment: Array | None = None,
+        sellers: Array | None = None,
+    ) -> None:
+        producers = [configuration.at(*position) for position in self.producers]
+        price = np.empty(self.length * self.length)
+        price[self.producer_cells] = [producer.price for producer in producers]
+        price[self.consumer_cells] = [configuration.at(*p).price for p in self.consumers]
+        self.__records["price"].append(price)
+        for field in self.PRODUCER_FIELDS:
+            self.__records[field].append(
+                np.array([getattr(producer, field) for producer in producers])
+            )
+        # Nobody bought anything before the first step
+        nobody = np.full(len(self.consumers), -1, dtype=np.int64)
+        self.__records["assignment"].append(nobody if assignment is None else assignment.copy())
+        self.__records["sellers"].append(
+            np.zeros_like(nobody) if sellers is None else sellers.copy()
+        )
+
+    def stacked(self, field: str) -> Array:
+        # (steps x cells) for prices, (steps x consumers) for purchases and
+        # (steps x producers) for the rest
+        steps = len(self)
+        cached = self.__stacked.get(field)
+        if cached is None or cached[0] != steps:
+            values = self.__records[field]
+            if field == "price":
+                width = self.length * self.length
+            elif field in self.PURCHASE_FIELDS:
+                width = len(self.consumers)
+            else:
+                width = len(self.producers)
+            cached = (steps, np.array(values).reshape(steps, width))
+            self.__stacked[field] = cached
+        return cached[1]
+
+    def alive(self) -> Array:
+        bankrupted = self.stacked("bankrupted").astype(bool)
+        return ~bankrupted if self.bankrupt_enabled else np.ones_like(bankrupted)
+
+    def on_lattice(self, values: Array, fill: float = np.nan) -> Array:
+        lattice = np.full((values.shape[0], self.length * self.length), fill)
+        lattice[:, self.producer_cells] = values
+        return lattice
+
+
+def _nested(history: StateHistory, values: Array) -> List[Any]:
+    lattices: List[Any] = values.reshape(-1, history.length, history.length).tolist()
+    return lattices
+
+
+def _categorized(history: StateHistory, values: Array) -> List[Any]:
+    types = history.agent_types.reshape(history.length, history.length).tolist()
+    return [
+        [list(zip(row, types_row)) for row, types_row in zip(step, types)]
+        for step in _nested(history, values)
+    ]
+
+
+def _percent_change(last: Array, previous: Array) -> Array:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(previous != 0, (last - previous) / previous * 100, 0)
+
+
+def _mean(values: Array, mask: Array) -> List[float]:
+    count = mask.sum(axis=1)
+    total = np.where(mask, values, 0).sum(axis=1)
+    return np.divide(
+        total,
+        count,
+        out=np.full(total.shape, np.nan),
+        where=count > 0,
+    ).tolist()
+
+
+def _alive_only(history: StateHistory, values: Array) -> Array:
+    return np.where(history.alive(), values, np.nan)
+
+
+def _price_lattice(history: StateHistory) -> Array:
+    dead = ~history.on_lattice(history.alive(), fill=True).astype(bool)
+    return np.where(dead, np.nan, history.stacked("price"))
+
+
+def _capital(history: StateHistory) -> Array:
+    return history.on_lattice(_alive_only(history, history.stacked("capital")))
+
+
+def _profit(history: StateHistory) -> Array:
+    return history.on_lattice(_alive_only(history, history.stacked("last_profit")))
+
+
+def _profit_change(history: StateHistory) -> Array:
+    changes = _percent_change(history.stacked("last_profit"), history.stacked("previous_profit"))
+    return _alive_only(history, changes)
+
+
+def _price_change(history: StateHistory) -> Array:
+    prices = history.stacked("price")[:, history.producer_cells]
+    changes = _percent_change(prices, history.stacked("previous_price"))
+    return _alive_only(history, changes)
+
+
+def _gini(history: StateHistory) -> List[float]:
+    prices = np.sort(np.trunc(history.stacked("price")[:, history.consumer_cells]), axis=1)
+    n = prices.shape[1]
+    if n == 0:
+        return [np.nan] * len(history)
+    # Mean absolute difference between every pair, from the sorted prices
+    weights = 2 * np.arange(n) - n + 1
+    mad = 2 * (prices * weights).sum(axis=1) / n**2
+    mean = prices.mean(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(mean != 0, 0.5 * mad / mean, 0).tolist()
+
+
+DERIVATIONS: Dict[str, Callable[[StateHistory], List[Any]]] = {
+    "agent_types_lattice": lambda history: _nested(
+        history, np.tile(history.agent_types, (len(history), 1))
+    ),
+    "price_lattice": lambda history: _nested(history, _price_lattice(history)),
+    "capital_lattice": lambda history: _nested(history, _capital(history)),
+    "agent_types_categorized_lattice": lambda history: _categorized(
+        history, np.tile(history.agent_types, (len(history), 1))
+    ),
+    "price_categorized_lattice": lambda history: _categorized(
+        history, history.stacked("price").astype(np.int64)
+    ),
+    "profit_categorized_lattice": lambda history: _categorized(history, _profit(history)),
+    "capital_categorized_lattice": lambda history: _categorized(history, _capital(history)),
+    "percent_profit_change_lattice": lambda history: _categorized(
+        history, history.on_lattice(_profit_change(history))
+    ),
+    "percent_price_change_lattice": lambda history: _categorized(
+        history, history.on_lattice(_price_change(history))
+    ),
+    "average_profit": lambda history: _mean(history.stacked("last_profit"), history.alive()),
+    "average_profit_change": lambda history: _mean(_profit_change(history), history.alive()),
+    "average_price": lambda history: (
+        _price_lattice(history).sum(axis=1) / history.length**2
+    ).tolist(),
+    "average_price_change": lambda history: _mean(_price_change(history), history.alive()),
+    "average_consumer_price": lambda history: _mean(
+        history.stacked("price")[:, history.consumer_cells],
+        np.ones((len(history), len(history.consumers)), dtype=bool),
+    ),
+    "average_producer_price": lambda history: _mean(
+        history.stacked("price")[:, history.producer_cells],
+        np.ones((len(history), len(history.producers)), dtype=bool),
+    ),
+    "gini_prices_distribution": _gini,
+    "alive_producers": lambda history: history.alive().sum(axis=1).astype(float).tolist(),
+    "consumers_per_producer": lambda history: list(
+        consumers_per_producer(history.stacked("assignment"), len(history.producers))
+    ),
+    "market_share_hhi": lambda history: herfindahl(
+        consumers_per_producer(history.stacked("assignment"), len(history.producers))
+    ).tolist(),
+    "local_monopolies": lambda history: local_monopolies(
+        history.stacked("assignment"), history.stacked("sellers"), len(history.producers)
+    )
+    .astype(float)
+    .tolist(),
+}
+
+
+class DerivedSeries(MutableMapping[str, Any]):
+    def __init__(self, history: StateHistory, names: Iterable[str]) -> None:
+        self.history = history
+        self.__names = [name for name in names if name in DERIVATIONS]
+        self.__derived: Dict[str, Tuple[int, List[Any]]] = {}
+        self.__stored: Dict[str, Any] = {}
+
+    def __repr__(self) -> str:
+        return "{}(steps={}, derived={})".format(
+            type(self).__name__,
+            len(self.history),
+            list(self.__derived),
+        )
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self.__stored:
+            return self.__stored[name]
+        if name not in self.__names:
+            raise KeyError(name)
+        steps = len(self.history)
+        derived = self.__derived.get(name)
+        if derived is None or derived[0] != steps:
+            derived = (steps, DERIVATIONS[name](self.history))
+            self.__derived[name] = derived
+        return derived[1]
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self.__stored[name] = value
+
+    def __delitem__(self, name: str) -> None:
+        if name in self.__stored:
+            del self.__stored[name]
+        elif name in self.__names:
+            self.__names.remove(name)
+            self.__derived.pop(name, None)
+        else:
+            raise KeyError(name)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.__names
+        yield from (name for name in self.__stored if name not in self.__names)
+
+    def __len__(self) -> int:
+        return len(set(self.__names) | set(self.__stored))
@@ -0,0 +1,248 @@
+import math
+import os
+import resource
+import socket
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple
+
+PREFIX = "market"
+
+
+class WorkerSample(NamedTuple):
+    worker: str
+    resident_bytes: int
+    steps: int
+
+
+class Progress(NamedTuple):
+    steps: int
+    steps_per_second: float
+    experiments_done: int
+    experiments_running: int
+    experiments_queued: int
+    eta_seconds: float
+    elapsed_seconds: float
+    workers: Dict[str, WorkerSample]
+
+
+def resident_memory() -> int:
+    # Current resident set in bytes, or the peak where /proc is missing
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Telemetry:
+    # Progress of runs and sweeps. Counting a step is an increment and a
+    # clock read; the progress is only computed and published every
+    # `interval` seconds, to the callback and to `path`, a text file in
+    # Prometheus' exposition format (e.g. for node_exporter's textfile
+    # collector) rewritten atomically.
+    def __init__(
+        self,
+        callback: Callable[[Progress], None] | None = None,
+        path: str | Path | None = None,
+        interval: float = 5.0,
+        worker: str | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.callback = callback
+        self.path = None if path is None else Path(path)
+        self.interval = interval
+        self.worker = worker or worker_name()
+        self.clock = clock
+        self.steps = 0
+        self.expected_steps = 0
+        self.experiments_done = 0
+        self.experiments_running = 0
+        self.experiments_queued = 0
+        self.workers: Dict[str, WorkerSample] = {}
+        self.started = clock()
+        self.__published_at = self.started
+        self.__published_steps = 0
+        self.__steps_per_second = math.nan
+
+    def __repr__(self) -> str:
+        return "{}(path={}, interval={}, steps={}, experiments_done={})".format(
+            type(self).__name__,
+            self.path,
+            self.interval,
+            self.steps,
+            self.experiments_done,
+        )
+
+    @property
+    def directory(self) -> Path | None:
+        # Where workers write their own metrics files
+        return None if self.path is None else self.path.parent
+
+    def queue(self, experiments: int, steps_each: int = 0) -> None:
+        self.experiments_queued += experiments
+        self.expected_steps += experiments * steps_each
+        self.__publish_if_due()
+
+    def experiment_started(self, max_steps: int = 0) -> None:
+        if self.experiments_queued:
+            self.experiments_queued -= 1
+        else:
+            self.expected_steps += max_steps
+        self.experiments_running += 1
+        self.__publish_if_due()
+
+    def step_done(self) -> None:
+        self.steps += 1
+        if self.clock() - self.__published_at >= self.interval:
+            self.publish()
+
+    def experiment_done(self, steps: int | None = None, sample: WorkerSample | None = None) -> None:
+        # Steps are given when the experiment ran elsewhere (e.g. in a worker)
+        self.experiments_running = max(self.experiments_running - 1, 0)
+        self.experiments_done += 1
+        if steps is not None:
+            self.steps += steps
+        if sample is not None:
+            self.workers[sample.worker] = sample
+        self.__publish_if_due()
+
+    def sample(self) -> WorkerSample:
+        return WorkerSample(self.worker, resident_memory(), self.steps)
+
+    def __publish_if_due(self) -> None:
+        if self.clock() - self.__published_at >= self.interval:
+            self.publish()
+
+    def progress(self) -> Progress:
+        now = self.clock()
+        window = now - self.__published_at
+        if window > 0:
+            self.__steps_per_second = (self.steps - self.__published_steps) / window
+        elapsed = now - self.started
+        remaining = self.experiments_queued + self.experiments_running
+        rate = self.__steps_per_second
+        if self.expected_steps > self.steps and rate > 0:
+            eta = (self.expected_steps - self.steps) / rate
+        elif remaining and self.experiments_done:
+            eta = remaining * elapsed / self.experiments_done
+        else:
+            eta = 0.0 if not remaining else math.nan
+        return Progress(
+            steps=self.steps,
+            steps_per_second=rate,
+            experiments_done=self.experiments_done,
+            experiments_running=self.experiments_running,
+            experiments_queued=self.experiments_queued,
+            eta_seconds=eta,
+            elapsed_seconds=elapsed,
+            workers={**self.workers, self.worker: self.sample()},
+        )
+
+    def publish(self) -> Progress:
+        progress = self.progress()
+        self.__published_at = self.clock()
+        self.__published_steps = self.steps
+        if self.path is not None:
+            self.__write(progress)
+        if self.callback is not None:
+            self.callback(progress)
+        return progress
+
+    def __write(self, progress: Progress) -> None:
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help: str, values: Dict[str, float]) -> None:
+            lines.append(f"# HELP {PREFIX}_{name} {help}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in values.items():
+                lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+        own = f'{{worker="{_label(self.worker)}"}}'
+        workers = {
+            f'{{worker="{_label(name)}"}}': sample for name, sample in progress.workers.items()
+        }
+        metric("steps_total", "counter", "Steps completed.", {own: progress.steps})
+        metric(
+            "steps_per_second",
+            "gauge",
+            "Steps per second lately.",
+            {own: progress.steps_per_second},
+        )
+        metric(
+            "experiments_done_total",
+            "counter",
+            "Experiments completed.",
+            {own: progress.experiments_done},
+        )
+        metric(
+            "experiments_running",
+            "gauge",
+            "Experiments started and not completed.",
+            {own: progress.experiments_running},
+        )
+        metric(
+            "experiments_queued",
+            "gauge",
+            "Experiments not started yet.",
+            {own: progress.experiments_queued},
+        )
+        metric("eta_seconds", "gauge", "Estimated seconds to finish.", {own: progress.eta_seconds})
+        metric(
+            "worker_resident_bytes",
+            "gauge",
+            "Resident memory of each worker.",
+            {labels: sample.resident_bytes for labels, sample in workers.items()},
+        )
+        metric(
+            "worker_steps_total",
+            "counter",
+            "Steps completed by each worker.",
+            {labels: sample.steps for labels, sample in workers.items()},
+        )
+        metric("updated_seconds", "gauge", "Unix time of this update.", {own: time.time()})
+
+        assert self.path is not None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path.parent, prefix=".tmp-", suffix=".prom", delete=False
+        ) as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(file.name, self.path)
+
+    def close(self) -> Progress:
+        return self.publish()
+
+
+# Telemetry of the runs of this process that were not given one, e.g. in a
+# sweep worker
+_active: Telemetry | None = None
+
+
+def active_telemetry() -> Telemetry | None:
+    return _active
+
+
+def install(telemetry: Telemetry | None) -> None:
+    global _active
+    _active = telemetry
+
+
+def worker_telemetry(directory: str | Path | None, interval: float = 5.0) -> Telemetry:
+    # The telemetry of this worker process, created on its first experiment
+    if _active is None:
+        worker = worker_name()
+        path = None if directory is None else Path(directory) / f"worker-{worker}.prom"
+        install(Telemetry(path=path, interval=interval, worker=worker))
+    assert _active is not None
+    return _active
@@ -0,0 +1,20 @@
+from typing import Any, Callable, Iterable
+
+import pytest
+
+from src.golden import GOLDEN_SCENARIOS
+from src.sweep import ExperimentSpec
+
+
+@pytest.fixture
+def golden_spec() -> Callable[..., ExperimentSpec]:
+    # A golden scenario (see src.golden) with some spec fields, like seed or
+    # max_steps, and Market parameters changed
+    def spec_with(name: str, series: Iterable[str] = (), **changes: Any) -> ExperimentSpec:
+        spec = GOLDEN_SCENARIOS[name]
+        fields = {field: changes.pop(field) for field in spec._fields if field in changes}
+        return spec._replace(
+            parameters={**spec.parameters, **changes}, series=tuple(series), **fields
+        )
+
+    return spec_with
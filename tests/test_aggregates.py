@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from src.aggregates import RunningMean
+from src.sweep import run_experiment
+
+AGGREGATES = ("average_consumer_price", "average_producer_price", "average_profit")
+
+
+def test_running_mean() -> None:
+    running = RunningMean([1.0, 2.0, 3.0])
+    assert running.value == 2.0
+    running.replace(3.0, 6.0)
+    assert running.value == 3.0
+    running.remove(6.0)
+    assert running.value == 1.5
+    running.add(4.5)
+    assert running.value == 2.5
+    running.reset([])
+    assert np.isnan(running.value)
+
+
+@pytest.mark.parametrize("batched_clearing", [False, True])
+def test_incremental_aggregates_match_the_full_ones(golden_spec, batched_clearing) -> None:
+    full = run_experiment(
+        golden_spec(
+            "equilibrio_dinamico", AGGREGATES, max_steps=30, batched_clearing=batched_clearing
+        )
+    )
+    incremental = run_experiment(
+        golden_spec(
+            "equilibrio_dinamico",
+            AGGREGATES,
+            max_steps=30,
+            batched_clearing=batched_clearing,
+            incremental_aggregates=True,
+            check_aggregates=True,
+            resync_every=7,
+        )
+    )
+    assert full.summary["bankruptcies"] > 0
+    for name in AGGREGATES:
+        np.testing.assert_allclose(incremental.series[name], full.series[name], rtol=1e-12)
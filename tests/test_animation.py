@@ -0,0 +1,71 @@
+import numpy as np
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.neighborhood import Moore
+from simulab.simulation.core.runner import Runner
+
+from src.animation import animation_figure, encode_animation
+from src.market import Market
+
+
+def categorized(values, categories):  # type: ignore[no-untyped-def]
+    return [list(zip(row, types)) for row, types in zip(values, categories)]
+
+
+def test_frames_are_rebuilt_from_the_deltas() -> None:
+    np.random.seed(3)
+    types = np.random.randint(0, 2, size=(4, 4))
+    lattices = [np.random.rand(4, 4).round(1) for _ in range(12)]
+    lattices[5][0, 0] = np.nan
+    lattices[6][0, 0] = np.nan
+    series = [categorized(values.tolist(), types.tolist()) for values in lattices]
+
+    animation = encode_animation(series)
+    assert animation.steps.tolist() == list(range(12))
+    for (step, values, categories), expected in zip(animation.frames(), lattices):
+        np.testing.assert_array_equal(values, expected)
+        np.testing.assert_array_equal(categories, types)
+    assert 0 not in animation.deltas[5].cells
+    assert animation.categorized()[3] == series[3]
+
+    decimated = encode_animation(series, every=5)
+    assert decimated.steps.tolist() == [0, 5, 10, 11]
+    last_step, last_values, _ = list(decimated.frames())[-1]
+    np.testing.assert_array_equal(last_values, lattices[11])
+
+
+def test_unchanged_frames_are_dropped() -> None:
+    types = [[0, 1], [1, 0]]
+    series = [
+        categorized(values, types)
+        for values in ([[1, 2], [3, 4]], [[1, 2], [3, 4]], [[1, 5], [3, 4]], [[1, 5], [3, 4]])
+    ]
+    animation = encode_animation(series, changed_only=True)
+    assert animation.steps.tolist() == [0, 2, 3]
+    assert animation.deltas[0].cells.tolist() == [1]
+    assert animation.deltas[1].cells.size == 0
+    assert encode_animation(series).steps.tolist() == [0, 1, 2, 3]
+
+
+def test_agent_types_are_a_single_static_frame() -> None:
+    params = ExperimentParametersSet(
+        length=[10],
+        neighborhood=[Moore],
+        agent_types=[2],
+        producer_probability=[0.2],
+    )
+    runner = Runner(Market, params, WithoutCriterion(), max_steps=20)
+    runner.start()
+    series = runner.experiments[0].series
+
+    types = encode_animation(series["agent_types_categorized_lattice"])
+    assert types.static
+    figure = animation_figure(types, "Tipos de agentes", agent_types=2)
+    assert len(figure.data) == 3
+    assert len(figure.frames) == 0
+
+    prices = encode_animation(series["price_categorized_lattice"], every=4)
+    figure = animation_figure(prices, "Evolución del precio", agent_types=2)
+    assert [frame.name for frame in figure.frames] == [f"Step {step}" for step in prices.steps]
+    full = sum(np.array(lattice).nbytes for lattice in series["price_categorized_lattice"])
+    assert prices.nbytes < full
@@ -0,0 +1,98 @@
+import json
+import random
+
+import numpy as np
+import pytest
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.runner import Runner
+
+from src.banded_market import RECORDABLE, BandedMarket
+from src.golden import GOLDEN_DIRECTORY, GOLDEN_SCENARIOS, Trace, compare
+from src.market import Market
+from src.sweep import neighborhood_from
+
+
+def test_replays_the_golden_traces_band_by_band(tmp_path) -> None:
+    # Scenarios where every consumer buys one unit, so that only the
+    # initial agents are random
+    for name in ("basic_example", "monopolios_basic", "monopolios_complex"):
+        spec = GOLDEN_SCENARIOS[name]
+        random.seed(spec.seed)
+        np.random.seed(spec.seed)
+        parameters = ExperimentParametersSet(
+            **{parameter: [value] for parameter, value in spec.parameters.items()},
+            neighborhood=[neighborhood_from(spec.neighborhood)],
+        )
+        runner = Runner(Market, parameters, WithoutCriterion(), max_steps=0)
+        runner.start()
+
+        expected = Trace.load(GOLDEN_DIRECTORY / f"{name}.npz")
+        for band_rows in (1, 4):
+            with BandedMarket(
+                tmp_path / f"{name}-{band_rows}",
+                length=spec.parameters["length"],
+                neighborhood=spec.neighborhood,
+                band_rows=band_rows,
+                capital=spec.parameters.get("capital", 1_000_000),
+                quantity_to_buy=spec.parameters["quantity_to_buy"],
+                profit_period=spec.parameters["profit_period"],
+                recorded=RECORDABLE,
+            ) as market:
+                market.load_agents(runner.experiments[0].configuration)
+                series = market.run(spec.max_steps)
+                actual = Trace(
+                    fields={field: np.array(market.recorded_series(field)) for field in RECORDABLE},
+                    series={name: np.array(values) for name, values in series.items()},
+                )
+                assert compare(expected._replace(series={}), actual) is None
+                # Sums in another order
+                compared = Trace({}, {series: expected.series[series] for series in actual.series})
+                assert compare(compared, actual, rtol=1e-12) is None
+
+
+def test_results_do_not_depend_on_the_band_size(tmp_path) -> None:
+    runs = []
+    for band_rows in (3, 7, 20):
+        with BandedMarket(
+            tmp_path / str(band_rows),
+            length=20,
+            neighborhood="ExpandedMoore(2)",
+            band_rows=band_rows,
+            seed=3,
+            capital=40,
+            fixed_cost=(7, 0),
+            marginal_cost=(10, 1),
+            quantity_to_buy=(1, 0.5),
+            profit_period=2,
+            producer_probability=0.2,
+            bankrupt_enabled=True,
+            recorded=("price", "capital"),
+        ) as market:
+            market.generate()
+            series = market.run(15)
+            runs.append((series, np.array(market.recorded_series("price"))))
+    assert runs[0][0]["alive_producers"][-1] < runs[0][0]["alive_producers"][0]
+    for series, prices in runs[1:]:
+        np.testing.assert_allclose(
+            np.array(series["average_profit"]), runs[0][0]["average_profit"], rtol=1e-12
+        )
+        np.testing.assert_array_equal(prices, runs[0][1])
+
+
+def test_runs_without_recorded_lattices(tmp_path) -> None:
+    with BandedMarket(tmp_path, length=6, band_rows=2, seed=1, recorded=()) as market:
+        market.generate()
+        series = market.run(2)
+    assert len(series["average_price"]) == 3
+    assert json.loads((tmp_path / "series" / "numeric.json").read_text()) == series
+    assert [path.name for path in (tmp_path / "series").iterdir()] == ["numeric.json"]
+
+
+def test_steps_stay_within_the_recorded_series(tmp_path) -> None:
+    with BandedMarket(tmp_path, length=6, band_rows=2, seed=1) as market:
+        market.generate()
+        market.run(2)
+        with pytest.raises(AssertionError, match="room for 2 steps"):
+            market.step()
+        assert market.recorded_series("price").shape == (3, 6, 6)
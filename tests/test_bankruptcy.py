@@ -0,0 +1,140 @@
+import random
+from copy import deepcopy
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.neighborhood import ExpandedMoore
+from simulab.simulation.core.runner import Runner
+
+from src.bankrupt_utils import (
+    StrategySummary,
+    bankruptcy_events,
+    bankrupted_on,
+    create_configuration,
+    execute_with,
+    run_strategy,
+    strategy_spec,
+)
+from src.bankruptcy import BankruptcyEvent, BankruptcyLog
+from src.market import Market
+from src.producer import Producer
+from src.sweep import iter_experiments
+
+
+def test_bankruptcy_log_counts() -> None:
+    log = BankruptcyLog(producers=3)
+    assert log.alive == 3
+    assert log.bankrupted == 0
+
+    log.step = 4
+    log.register((0, 1), -10.0, True)
+    assert log.alive == 2
+    assert log.is_bankrupted((0, 1))
+    assert log.current() == [BankruptcyEvent(4, (0, 1), -10.0, True)]
+
+    log.step = 6
+    log.register((0, 1), 5.0, False)
+    assert log.alive == 3
+    assert log.current() == []
+    assert len(log.events) == 2
+
+
+def test_bankruptcy_log_is_shared_between_copies() -> None:
+    log = BankruptcyLog(producers=1)
+    producer = Producer(
+        capital=10,
+        stock=10,
+        price=10.0,
+        fixed_cost=100.0,
+        marginal_cost=3.5,
+        profit_period=1,
+    )
+    producer.report_to(log, (2, 3))
+    copy = deepcopy(producer)
+    assert copy.bankruptcy_log is log
+
+    copy.balance_check()
+    assert copy.bankrupted
+    assert log.current() == [BankruptcyEvent(0, (2, 3), -90.0, True)]
+
+
+def test_bankruptcy_log_matches_final_capitals() -> None:
+    random.seed(1)
+    np.random.seed(1)
+    params = ExperimentParametersSet(
+        length=[10],
+        neighborhood=[ExpandedMoore(2)],
+        agent_types=[2],
+        capital=[50],
+        producer_probability=[0.3],
+        profit_period=[3],
+        price_ratio=[(1.2, 1.5)],
+        fixed_cost=[(10, 1)],
+        marginal_cost=[(10, 1)],
+        quantity_to_buy=[(1, 0)],
+        bankrupt_enabled=[True],
+    )
+    runner = Runner(Market, params, WithoutCriterion(), max_steps=100)
+    runner.start()
+
+    experiment = runner.experiments[0]
+    producers = experiment._by_type[Producer.TYPE]
+    bankrupted = {event.position for event in bankruptcy_events(runner)}
+    assert bankrupted
+    assert bankrupted == {
+        position for position in producers if experiment.get_agent(*position).capital <= 0
+    }
+    assert experiment.series["alive_producers"][-1] == len(producers) - len(bankrupted)
+    assert sum(bankrupted_on(runner)) == len(bankrupted)
+
+
+def test_strategy_summary_columns() -> None:
+    summary = StrategySummary(capacity=2)
+    for run in range(5):
+        summary.add(
+            "Con bancarrota" if run % 2 else "Sin bancarrota",
+            None if run == 4 else run,
+            {
+                "bankruptcies": run,
+                "solvent": 10 - run,
+                "capital_mean": 1.5 * run,
+                "capital_std": 0.0,
+                "capital_min": -run,
+                "capital_median": 1.0,
+                "capital_max": 2.0 * run,
+            },
+        )
+    assert (len(summary), summary.capacity) == (5, 8)
+
+    frame = summary.to_frame()
+    assert list(frame["strategy"]) == ["Sin bancarrota", "Con bancarrota"] * 2 + ["Sin bancarrota"]
+    assert list(frame["seed"][:4]) == [0, 1, 2, 3] and frame["seed"][4] is pd.NA
+    assert list(frame["bankrupt"] + frame["solvent"]) == [10] * 5
+    assert list(frame["capital_max"]) == [0.0, 2.0, 4.0, 6.0, 8.0]
+
+    counts = summary.counts_frame()
+    assert list(counts.columns) == ["Capital", "Cantidad", "Estrategia"]
+    assert list(counts["Cantidad"][:4]) == [0, 10, 1, 9]
+    assert list(counts["Estrategia"][:4]) == ["Sin bancarrota"] * 2 + ["Con bancarrota"] * 2
+
+
+def test_strategy_summaries_from_runs_and_sweeps() -> None:
+    local = StrategySummary()
+    data: Dict[str, List[Any]] = {}
+    for bankrupt_enabled in (False, True):
+        configuration = create_configuration(producer_probability=0.1, crn_seed=7)
+        label = f"{'Con' if bankrupt_enabled else 'Sin'} bancarrota (prob: 0.1)"
+        run_strategy(configuration, local, label, 7, 10, bankrupt_enabled)
+        execute_with(configuration, data, label, 10, bankrupt_enabled)
+
+    swept = StrategySummary()
+    specs = [strategy_spec(0.1, 7, bankrupt_enabled, 10) for bankrupt_enabled in (False, True)]
+    for result in iter_experiments(specs):
+        swept.add_result(result)
+
+    pd.testing.assert_frame_equal(swept.to_frame(), local.to_frame())
+    pd.testing.assert_frame_equal(local.counts_frame(), pd.DataFrame(data))
+    assert list(local.to_frame()["solvent"]) == [40, 40]
@@ -0,0 +1,78 @@
+import csv
+import json
+
+from src.batch import jobs_from, load_results, main
+from src.sweep import run_experiment
+
+MANIFEST = {
+    "defaults": {
+        "neighborhood": "Moore",
+        "max_steps": 5,
+        "series": ["average_price"],
+        "parameters": {"quantity_to_buy": [1, 0]},
+    },
+    "experiments": [
+        {"name": "monopolios", "scenario": "monopolios_basic", "seeds": [1, 2]},
+        {
+            "name": "generada",
+            "parameters": {"length": 8},
+            "vary": {"producer_probability": [0.1, 0.3]},
+            "repetitions": 2,
+            "seed": 10,
+        },
+    ],
+}
+
+
+def test_jobs_from_the_manifest() -> None:
+    jobs = jobs_from(MANIFEST)
+    assert len(jobs) == 6
+    assert len({job.id for job in jobs}) == 6
+    monopolio = jobs[0].spec
+    assert monopolio.parameters["length"] == 6
+    assert monopolio.parameters["quantity_to_buy"] == (1, 0)
+    assert [job.spec.seed for job in jobs[2:]] == [10, 11, 10, 11]
+    assert jobs_from(MANIFEST) == jobs
+
+
+def test_an_interrupted_batch_resumes(tmp_path, capsys) -> None:
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(MANIFEST))
+    output = tmp_path / "results"
+
+    assert main([str(manifest), "--output", str(output), "--workers", "2"]) == 0
+    results = load_results(output)
+    assert len(results) == 6
+    job = jobs_from(MANIFEST)[3]
+    assert results[job.id] == run_experiment(job.spec)
+
+    # Losing one result (e.g. killed before writing it) only reruns that job
+    (output / f"{job.id}.pickle").unlink()
+    (output / ".tmp-partial").write_bytes(b"partial")
+    capsys.readouterr()
+    assert main([str(manifest), "--output", str(output), "--workers", "2"]) == 0
+    printed = capsys.readouterr().out
+    assert "5 of 6 jobs already completed" in printed
+    assert f"[1/1] {job.id} done" in printed
+    assert not (output / ".tmp-partial").exists()
+
+    with open(output / "summaries.csv") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["job"] for row in rows] == [job.id for job in jobs_from(MANIFEST)]
+    assert float(rows[3]["average_price"]) == results[job.id].summary["average_price"]
+
+
+def test_a_batch_reports_its_progress(tmp_path) -> None:
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(MANIFEST))
+    output = tmp_path / "results"
+    metrics = tmp_path / "metrics" / "batch.prom"
+
+    arguments = [str(manifest), "--output", str(output), "--workers", "2"]
+    assert main(arguments + ["--metrics", str(metrics)]) == 0
+    assert len(load_results(output)) == 6
+    lines = metrics.read_text().splitlines()
+    assert any(
+        line.startswith("market_experiments_done_total{") and line.endswith(" 6") for line in lines
+    )
+    assert any(line.startswith("market_steps_total{") and line.endswith(" 30") for line in lines)
@@ -0,0 +1,65 @@
+import os
+from multiprocessing import Pool
+
+from scenarios.monopolios_basic import config as monopolios_basic_conf
+from src.cache import ResultCache, stable_hash
+from src.consumer import Consumer
+from src.sweep import ExperimentSpec, cache_key, run_experiment
+
+
+def spec_with(seed: int) -> ExperimentSpec:
+    return ExperimentSpec(
+        parameters=dict(length=6, agent_types=2, configuration=monopolios_basic_conf),
+        neighborhood="Moore",
+        seed=seed,
+        max_steps=5,
+        series=("price_lattice",),
+    )
+
+
+def test_stable_hash() -> None:
+    assert stable_hash({"a": 1, "b": (2, 3)}) == stable_hash({"b": [2, 3], "a": 1})
+    assert stable_hash({"a": 1}) != stable_hash({"a": 2})
+    assert stable_hash([Consumer()]) == stable_hash([Consumer()])
+
+
+def test_cache_key_depends_on_the_spec() -> None:
+    assert cache_key(spec_with(1)) == cache_key(spec_with(1))
+    assert cache_key(spec_with(1)) != cache_key(spec_with(2))
+    assert cache_key(spec_with(1)) != cache_key(spec_with(1)._replace(max_steps=6))
+
+
+def test_repeated_runs_are_loaded_from_the_cache(tmp_path) -> None:
+    cache = ResultCache(tmp_path)
+    spec = spec_with(1)
+    first = run_experiment(spec, cache=cache)
+    assert cache.get(cache_key(spec)) == first
+    # A cached entry is returned even if it no longer matches a fresh run
+    cache.put(cache_key(spec), first._replace(summary={"fake": 1.0}))
+    assert run_experiment(spec, cache=cache).summary == {"fake": 1.0}
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path) -> None:
+    cache = ResultCache(tmp_path, max_bytes=2_500)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 1_000)
+    assert cache.get("a") is None
+    os.utime(tmp_path / "b.pickle", (0, 0))
+    assert cache.get("c") is not None
+    cache.put("d", b"x" * 1_000)
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.size() <= 2_500
+
+
+def _run_cached(arguments):  # type: ignore[no-untyped-def]
+    directory, seed = arguments
+    return run_experiment(spec_with(seed), cache=ResultCache(directory, max_bytes=20_000))
+
+
+def test_cache_is_shared_between_processes(tmp_path) -> None:
+    arguments = [(tmp_path, seed % 4) for seed in range(16)]
+    with Pool(4) as pool:
+        results = pool.map(_run_cached, arguments)
+    for (_, seed), result in zip(arguments, results):
+        assert result.series == run_experiment(spec_with(seed)).series
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from src.clearing import MarketClearing
+from src.sweep import run_experiment
+
+SERIES = ("price_lattice", "capital_lattice")
+
+
+def neighbors_of(i: int, j: int):  # type: ignore[no-untyped-def]
+    # Consumers (0, k) see the producers (1, 0) and (1, 1), in that order
+    return [(1, 0), (1, 1)]
+
+
+def clearing_for(consumers: int) -> MarketClearing:
+    return MarketClearing(
+        consumers=[(0, k) for k in range(consumers)],
+        producers=[(1, 0), (1, 1)],
+        neighbors_of=neighbors_of,
+    )
+
+
+def test_orders_go_to_the_cheapest_seller() -> None:
+    clearing = clearing_for(consumers=3)
+    sold, assignment = clearing.clear(
+        prices=np.array([2.0, 1.0]),
+        stocks=np.array([100.0, 100.0]),
+        available=np.array([True, True]),
+        quantity_to_buy=(1, 0),
+    )
+    assert sold.tolist() == [0, 3]
+    assert assignment.tolist() == [1, 1, 1]
+
+
+def test_excess_demand_goes_to_the_next_cheapest_seller() -> None:
+    clearing = clearing_for(consumers=3)
+    sold, assignment = clearing.clear(
+        prices=np.array([2.0, 1.0]),
+        stocks=np.array([100.0, 2.0]),
+        available=np.array([True, True]),
+        quantity_to_buy=(1, 0),
+    )
+    assert sold.tolist() == [1, 2]
+    assert assignment.tolist() == [1, 1, 0]
+
+
+def test_unavailable_or_sold_out_sellers_leave_consumers_unserved() -> None:
+    clearing = clearing_for(consumers=3)
+    sold, assignment = clearing.clear(
+        prices=np.array([2.0, 1.0]),
+        stocks=np.array([100.0, 1.0]),
+        available=np.array([False, True]),
+        quantity_to_buy=(1, 0),
+    )
+    assert sold.tolist() == [0, 1]
+    assert assignment.tolist() == [1, -1, -1]
+
+
+def test_batched_clearing_matches_one_by_one_purchases(golden_spec) -> None:
+    spec = golden_spec("monopolios_complex", SERIES, seed=7, max_steps=20, quantity_to_buy=(1, 0.5))
+    sequential = run_experiment(spec)
+    batched = run_experiment(
+        spec._replace(parameters={**spec.parameters, "batched_clearing": True})
+    )
+    assert batched.series == sequential.series
+    assert batched.summary == sequential.summary
+
+
+def test_batched_clearing_supports_finite_stock(golden_spec, monkeypatch) -> None:
+    spec = golden_spec(
+        "monopolios_complex", seed=7, max_steps=20, quantity_to_buy=(1, 0.5), stock=30
+    )
+    clearings = []
+    clear = MarketClearing.clear
+
+    def recorded(self, prices, stocks, available, **kwargs):  # type: ignore[no-untyped-def]
+        sold, assignment = clear(self, prices, stocks, available, **kwargs)
+        clearings.append((self.candidates, prices, stocks, available, sold, assignment))
+        return sold, assignment
+
+    monkeypatch.setattr(MarketClearing, "clear", recorded)
+    result = run_experiment(spec._replace(parameters={**spec.parameters, "batched_clearing": True}))
+    assert result.summary["steps"] == 20
+
+    fallbacks = 0
+    for candidates, prices, stocks, available, sold, assignment in clearings:
+        # No producer sells more than its stock...
+        assert (sold <= stocks).all()
+        # ...and the consumers it could not serve buy from a pricier seller
+        served = assignment >= 0
+        offers = np.where((candidates >= 0) & available[candidates], prices[candidates], np.inf)
+        fallbacks += (prices[assignment[served]] > offers[served].min(axis=1)).sum()
+    assert fallbacks > 0
+
+    monkeypatch.undo()
+    with pytest.raises(AssertionError, match="Insufficient stock"):
+        run_experiment(spec)
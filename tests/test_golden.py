@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from src.golden import (
+    GOLDEN_DIRECTORY,
+    GOLDEN_SCENARIOS,
+    Trace,
+    check_golden,
+    compare,
+    record_trace,
+)
+
+
+@pytest.mark.parametrize(
+    "modes, tolerance",
+    [
+        ({}, 0.0),
+        ({"batched_clearing": True}, 0.0),
+        ({"deferred_series": True}, 1e-9),
+        ({"incremental_aggregates": True, "resync_every": 7}, 1e-9),
+    ],
+)
+def test_engines_replay_the_golden_traces(modes, tolerance) -> None:
+    divergences = check_golden(rtol=tolerance, atol=tolerance, **modes)
+    assert list(divergences) == list(GOLDEN_SCENARIOS)
+    assert all(divergence is None for divergence in divergences.values()), divergences
+
+
+def test_the_first_divergence_is_reported() -> None:
+    golden = Trace.load(GOLDEN_DIRECTORY / "equilibrio_dinamico.npz")
+    assert np.nanmax(golden.fields["bankrupted"]) == 1
+    assert compare(golden, golden) is None
+
+    fields = {name: values.copy() for name, values in golden.fields.items()}
+    series = {name: values.copy() for name, values in golden.series.items()}
+    producer = tuple(int(k) for k in np.argwhere(np.isfinite(golden.fields["capital"][7]))[-1])
+    fields["capital"][(7, *producer)] = np.nan
+    fields["last_profit"][9, 0, 0] += 1
+    series["average_price"][5] += 1e-12
+    changed = Trace(fields, series)
+
+    divergence = compare(golden, changed)
+    assert (divergence.step, divergence.field, divergence.cell) == (5, "average_price", None)
+    assert compare(golden, changed, rtol=1e-9).field == "capital"
+    divergence = compare(golden, changed, rtol=1e-9)
+    assert (divergence.step, divergence.cell) == (7, producer)
+    assert np.isnan(divergence.actual)
+    assert f"capital diverges at step 7 at cell {producer}" in str(divergence)
+
+    shorter = Trace(
+        {name: values[:20] for name, values in golden.fields.items()},
+        {name: values[:20] for name, values in golden.series.items()},
+    )
+    divergence = compare(golden, shorter)
+    assert (divergence.step, divergence.field) == (20, "price (steps)")
+
+
+def test_common_random_numbers_do_not_depend_on_the_engine() -> None:
+    spec = GOLDEN_SCENARIOS["equilibrio_dinamico"]
+    common = record_trace(spec, crn_seed=3)
+    assert compare(common, record_trace(spec, crn_seed=3, batched_clearing=True)) is None
+    assert compare(common, record_trace(spec, crn_seed=4)) is not None
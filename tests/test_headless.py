@@ -0,0 +1,48 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from src.sweep import ExperimentSpec, iter_experiments, worker_pool
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CORE_MODULES = (
+    "src.consumer",
+    "src.producer",
+    "src.profit_formula",
+    "src.market",
+    "src.bankrupt_utils",
+    "src.cache",
+    "src.sweep",
+)
+
+NOTEBOOK_MODULES = ("pandas", "plotly", "IPython", "ipykernel", "nbformat")
+
+
+def test_simulation_core_does_not_load_notebook_dependencies() -> None:
+    script = (
+        "import importlib, json, sys\n"
+        f"for name in {CORE_MODULES!r}: importlib.import_module(name)\n"
+        f"print(json.dumps([name for name in {NOTEBOOK_MODULES!r} if name in sys.modules]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert json.loads(output) == []
+
+
+def test_worker_pool_runs_experiments() -> None:
+    spec = ExperimentSpec(
+        parameters=dict(length=6, agent_types=2, producer_probability=0.2),
+        neighborhood="Moore",
+        seed=3,
+        max_steps=3,
+    )
+    with worker_pool(max_workers=1) as pool:
+        (result,) = iter_experiments([spec], executor=pool)
+    assert result.summary["steps"] == 3
@@ -0,0 +1,117 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from src.batch import jobs_from, load_results
+from src.job_queue import (
+    DONE,
+    FAILED,
+    PENDING,
+    RUNNING,
+    ClaimedJob,
+    JobQueue,
+    export,
+    main,
+    work,
+)
+from src.sweep import (
+    ExperimentResult,
+    ExperimentSpec,
+    run_experiment,
+    worker_context,
+)
+
+MANIFEST = {
+    "defaults": {"neighborhood": "Moore", "max_steps": 5, "series": ["average_price"]},
+    "experiments": [
+        {"name": "monopolios", "scenario": "monopolios_basic", "seed": 1, "repetitions": 8},
+    ],
+}
+
+
+def test_several_workers_drain_the_queue(tmp_path) -> None:
+    path = tmp_path / "queue.sqlite"
+    queue = JobQueue(path)
+    jobs = jobs_from(MANIFEST)
+    assert queue.submit(jobs) == 8
+    assert queue.submit(jobs) == 0
+
+    context = worker_context()
+    workers = [
+        context.Process(target=work, args=(path, f"worker-{k}"), kwargs={"lease_seconds": 30})
+        for k in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+
+    assert queue.counts() == {PENDING: 0, RUNNING: 0, DONE: 8, FAILED: 0}
+    results = dict((job.id, result) for job, result in queue.results())
+    assert results[jobs[5].id] == run_experiment(jobs[5].spec)
+
+    assert export(queue, tmp_path / "results") == 8
+    assert set(load_results(tmp_path / "results")) == {job.id for job in jobs}
+
+
+def test_expired_leases_are_claimed_again(tmp_path) -> None:
+    queue = JobQueue(tmp_path / "queue.sqlite", lease_seconds=0.2, max_attempts=2)
+    queue.submit(jobs_from(MANIFEST)[:1])
+
+    dead = queue.claim("dead")
+    assert dead is not None and dead.attempts == 1
+    assert queue.claim("alive") is None
+    time.sleep(0.3)
+    alive = queue.claim("alive")
+    assert alive is not None and alive.id == dead.id and alive.attempts == 2
+    # The dead worker can not renew nor fail a job it no longer holds
+    assert not queue.renew(dead, "dead")
+    queue.fail(dead, "dead", "too late")
+    assert queue.counts()[RUNNING] == 1
+
+    time.sleep(0.3)
+    assert queue.claim("other") is None
+    assert queue.counts()[FAILED] == 1
+
+
+def test_late_results_are_not_counted(tmp_path, monkeypatch) -> None:
+    path = tmp_path / "queue.sqlite"
+    queue = JobQueue(path, lease_seconds=0.2)
+    jobs = jobs_from(MANIFEST)[:2]
+    queue.submit(jobs)
+
+    def slow(spec: ExperimentSpec) -> ExperimentResult:
+        result = run_experiment(spec)
+        if spec == jobs[0].spec:
+            # The lease of this worker expired meanwhile and another one
+            # claimed the job and finished it first
+            late = ClaimedJob(jobs[0].id, jobs[0].name, spec, 1)
+            assert queue.complete(late, "other", result)
+        return result
+
+    monkeypatch.setattr("src.job_queue.run_experiment", slow)
+    assert work(path, "worker", lease_seconds=0.2) == 1
+    assert queue.counts()[DONE] == 2
+    with closing(sqlite3.connect(path)) as connection:
+        workers = dict(connection.execute("SELECT id, worker FROM jobs"))
+    assert workers == {jobs[0].id: "other", jobs[1].id: "worker"}
+
+
+def test_failed_jobs_are_retried(tmp_path, capsys) -> None:
+    path = tmp_path / "queue.sqlite"
+    broken = jobs_from(MANIFEST)[0]
+    broken = broken._replace(spec=broken.spec._replace(neighborhood="Unknown"))
+    queue = JobQueue(path, max_attempts=3)
+    queue.submit([broken, *jobs_from(MANIFEST)[1:3]])
+
+    assert work(path, "worker", max_attempts=3) == 2
+    assert queue.counts() == {PENDING: 0, RUNNING: 0, DONE: 2, FAILED: 1}
+    [(identifier, attempts, error)] = queue.failures()
+    assert identifier == broken.id and attempts == 3
+    assert "Unknown neighborhood" in error
+
+    assert main(["--queue", str(path), "status"]) == 0
+    captured = capsys.readouterr()
+    assert "done=2 failed=1" in captured.out
+    assert f"{broken.id} failed after 3 attempts" in captured.err
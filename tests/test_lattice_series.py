@@ -0,0 +1,57 @@
+import numpy as np
+
+from src.lattice_series import DeltaLatticeSeries
+from src.sweep import run_experiment
+
+LATTICES = (
+    "price_lattice",
+    "capital_lattice",
+    "agent_types_categorized_lattice",
+    "price_categorized_lattice",
+    "capital_categorized_lattice",
+)
+
+
+def test_any_step_is_rebuilt_from_its_keyframe() -> None:
+    np.random.seed(5)
+    lattices = [np.random.randint(0, 3, size=(3, 4)).astype(float) for _ in range(23)]
+    lattices[7][1, 2] = np.nan
+    series = DeltaLatticeSeries((lattice.tolist() for lattice in lattices), keyframe_every=5)
+    assert len(series) == 23
+    for step in [22, 3, 4, 15, 16, 0, 9, -1, -23]:
+        np.testing.assert_array_equal(series[step], lattices[step])
+    assert len(series[2:8]) == 6
+
+    types = [[0, 1], [1, 0]]
+    categorized = DeltaLatticeSeries(keyframe_every=3)
+    for step in range(7):
+        categorized.append([[(step * k, kind) for kind in row] for k, row in enumerate(types)])
+    assert categorized[4] == [[(0, 0), (0, 1)], [(4, 1), (4, 0)]]
+    values, categories = categorized.arrays(-1)
+    np.testing.assert_array_equal(categories, types)
+
+
+def test_compressed_lattices_match_the_snapshots(golden_spec) -> None:
+    full = run_experiment(golden_spec("equilibrio_dinamico", LATTICES, max_steps=40))
+    compressed = run_experiment(
+        golden_spec(
+            "equilibrio_dinamico",
+            LATTICES,
+            max_steps=40,
+            compressed_lattices=True,
+            keyframe_every=8,
+        )
+    )
+    np.testing.assert_equal(compressed.summary, full.summary)
+    for name in LATTICES:
+        assert isinstance(compressed.series[name], DeltaLatticeSeries)
+        assert len(compressed.series[name]) == len(full.series[name])
+        np.testing.assert_array_equal(
+            np.array(compressed.series[name][:], dtype=float),
+            np.array(full.series[name], dtype=float),
+            err_msg=name,
+        )
+    assert (
+        compressed.series["price_categorized_lattice"][:]
+        == full.series["price_categorized_lattice"]
+    )
@@ -0,0 +1,46 @@
+import numpy as np
+
+from scenarios.monopolios_basic import config as monopolios_basic_conf
+from src.market_share import (
+    consumers_per_producer,
+    herfindahl,
+    local_monopolies,
+)
+from src.sweep import ExperimentSpec, run_experiment
+
+
+def test_shares_from_the_assignments() -> None:
+    # Two steps, five consumers and three producers
+    assignment = np.array([[0, 0, 1, -1, 0], [-1, -1, -1, -1, -1]])
+    sellers = np.array([[1, 2, 1, 0, 3], [0, 0, 0, 0, 0]])
+    counts = consumers_per_producer(assignment, producers=3)
+    np.testing.assert_array_equal(counts, [[3, 1, 0], [0, 0, 0]])
+    hhi = herfindahl(counts)
+    assert hhi[0] == (3 / 4) ** 2 + (1 / 4) ** 2
+    assert np.isnan(hhi[1])
+    np.testing.assert_array_equal(local_monopolies(assignment, sellers, producers=3), [2, 0])
+
+
+def test_monopolies_of_the_basic_scenario() -> None:
+    spec = ExperimentSpec(
+        parameters=dict(
+            length=6,
+            agent_types=2,
+            configuration=monopolios_basic_conf,
+            quantity_to_buy=(1, 0),
+            profit_period=2,
+            marginal_cost=(10, 1),
+            fixed_cost=(20, 0),
+        ),
+        neighborhood="Moore",
+        seed=12345,
+        max_steps=3,
+        series=("consumers_per_producer", "market_share_hhi", "local_monopolies"),
+    )
+    for modes in ({}, {"batched_clearing": True}, {"deferred_series": True}):
+        result = run_experiment(spec._replace(parameters={**spec.parameters, **modes}))
+        # Four producers, each the only seller of the eight consumers around it
+        served = np.array(result.series["consumers_per_producer"])
+        np.testing.assert_array_equal(served, [[0] * 4] + [[8] * 4] * 3)
+        assert result.series["market_share_hhi"][1:] == [0.25] * 3
+        assert result.series["local_monopolies"] == [0.0, 4.0, 4.0, 4.0]
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.neighborhood import Moore
+from simulab.simulation.core.runner import Runner
+
+from src.market import Market
+from src.state_history import DERIVATIONS
+from src.sweep import ExperimentSpec, run_experiment
+
+
+@pytest.mark.parametrize("bankrupt_enabled", [False, True])
+def test_deferred_series_match_the_snapshots(golden_spec, bankrupt_enabled) -> None:
+    spec = golden_spec(
+        "equilibrio_dinamico", DERIVATIONS, max_steps=30, bankrupt_enabled=bankrupt_enabled
+    )
+    eager = run_experiment(spec)
+    deferred = run_experiment(
+        spec._replace(parameters={**spec.parameters, "deferred_series": True})
+    )
+    assert eager.summary["bankruptcies"] > 0
+    for name in DERIVATIONS:
+        expected = np.array(eager.series[name], dtype=float)
+        derived = np.array(deferred.series[name], dtype=float)
+        assert derived.shape == expected.shape, name
+        np.testing.assert_allclose(derived, expected, rtol=1e-12, equal_nan=True, err_msg=name)
+    assert deferred.series["price_categorized_lattice"] == eager.series["price_categorized_lattice"]
+
+
+def test_deferred_series_are_derived_once() -> None:
+    params = ExperimentParametersSet(
+        length=[10],
+        neighborhood=[Moore],
+        agent_types=[2],
+        producer_probability=[0.2],
+        deferred_series=[True],
+    )
+    runner = Runner(Market, params, WithoutCriterion(), max_steps=5)
+    runner.start()
+    series = runner.experiments[0].series
+    assert len(runner.experiments[0].state_history) == 6
+    assert series["average_price"] is series["average_price"]
+    assert len(series["price_lattice"]) == 6
+
+    series["custom"] = [1, 2, 3]
+    assert series["custom"] == [1, 2, 3]
+    assert "custom" in list(series)
+
+
+def test_summaries_do_not_derive_lattices(monkeypatch) -> None:
+    def underived(history):  # type: ignore[no-untyped-def]
+        raise AssertionError("lattice derived")
+
+    for name in DERIVATIONS:
+        if name.endswith("_lattice"):
+            monkeypatch.setitem(DERIVATIONS, name, underived)
+    spec = ExperimentSpec(
+        parameters=dict(length=10, agent_types=2, producer_probability=0.2, deferred_series=True),
+        neighborhood="Moore",
+        seed=2,
+        max_steps=5,
+    )
+    summary = run_experiment(spec).summary
+    monkeypatch.undo()
+    eager = run_experiment(spec._replace(parameters={**spec.parameters, "deferred_series": False}))
+    assert summary == pytest.approx(eager.summary, rel=1e-12, nan_ok=True)
@@ -0,0 +1,221 @@
+import asyncio
+import math
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.neighborhood import Moore
+from simulab.simulation.core.runner import Runner
+
+from scenarios.monopolios_basic import config as monopolios_basic_conf
+from src.market import Market
+from src.producer import Producer
+from src.sweep import (
+    ExperimentSpec,
+    common_random_specs,
+    confidence_width,
+    iter_adaptive_sweep,
+    iter_experiments,
+    neighborhood_from,
+    paired_difference,
+    replicates,
+    run_experiment,
+    stream_experiments,
+    sweep_specs,
+    t_quantile,
+)
+
+
+@pytest.fixture
+def spec() -> ExperimentSpec:
+    return ExperimentSpec(
+        parameters=dict(
+            length=6,
+            agent_types=2,
+            profit_period=2,
+            price_ratio=(1.2, 5),
+            fixed_cost=(20, 0),
+            marginal_cost=(10, 1),
+            quantity_to_buy=(1, 0),
+            configuration=monopolios_basic_conf,
+        ),
+        neighborhood="Moore",
+        seed=1234,
+        max_steps=10,
+        series=("average_price",),
+    )
+
+
+def test_neighborhood_from_name() -> None:
+    assert neighborhood_from("Moore") is Moore
+    assert neighborhood_from("ExpandedMoore(2)").size() == 24
+    with pytest.raises(ValueError):
+        neighborhood_from("Hexagonal")
+
+
+def test_sweep_specs(spec) -> None:
+    specs = sweep_specs(spec, repetitions=3, seed=10, profit_period=[2, 4])
+    assert len(specs) == 6
+    assert [each.seed for each in specs] == [10, 11, 12, 10, 11, 12]
+    assert [each.parameters["profit_period"] for each in specs] == [2, 2, 2, 4, 4, 4]
+
+
+def test_run_experiment_is_reproducible(spec) -> None:
+    first = run_experiment(spec)
+    second = run_experiment(spec)
+    assert len(first.series["average_price"]) == spec.max_steps + 1
+    assert first.series == second.series
+    assert first.summary == second.summary
+    assert first.summary["steps"] == spec.max_steps
+    assert first.summary["average_price"] == first.series["average_price"][-1]
+
+
+def test_stream_experiments_yields_every_result(spec) -> None:
+    specs = sweep_specs(spec, repetitions=5)
+
+    async def collect():  # type: ignore[no-untyped-def]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            return [
+                result
+                async for result in stream_experiments(specs, max_in_flight=2, executor=executor)
+            ]
+
+    results = asyncio.run(collect())
+    assert sorted(result.spec.seed for result in results) == list(range(5))
+
+
+def test_iter_experiments_can_stop_early(spec) -> None:
+    specs = sweep_specs(spec, repetitions=6)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = iter_experiments(specs, max_in_flight=2, executor=executor)
+        first = next(results)
+        results.close()
+    assert first.summary == run_experiment(first.spec).summary
+
+
+def test_t_quantile_approximates_student_t() -> None:
+    # Exact with few degrees of freedom, where intervals would be too narrow
+    assert t_quantile(0.975, 1) == pytest.approx(12.7062, rel=1e-4)
+    assert t_quantile(0.975, 2) == pytest.approx(4.3027, rel=1e-4)
+    assert t_quantile(0.995, 3) == pytest.approx(5.8409, rel=1e-4)
+    assert t_quantile(0.975, 4) == pytest.approx(2.7764, rel=1e-4)
+    assert t_quantile(0.025, 7) == pytest.approx(-2.3646, rel=1e-4)
+    assert t_quantile(0.975, 8) == pytest.approx(2.306, rel=1e-3)
+    assert t_quantile(0.975, 29) == pytest.approx(2.045, rel=1e-3)
+    assert confidence_width([1.0]) == math.inf
+
+
+def test_adaptive_sweep_spends_runs_where_the_variance_is(spec) -> None:
+    points = sweep_specs(spec, profit_period=[2, 4])
+    # Producers with almost equal costs vary little between seeds (their
+    # consumer price deviates about 0.1), widely spread costs a lot (about 9)
+    calm = {**spec.parameters, "marginal_cost": (10, 0.01), "price_ratio": (1.2, 1.21)}
+    noisy = {**spec.parameters, "marginal_cost": (10, 3), "price_ratio": (1.2, 5)}
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        loose = list(
+            iter_adaptive_sweep(
+                points,
+                "average_consumer_price",
+                target_width=math.inf,
+                min_repetitions=3,
+                executor=executor,
+            )
+        )
+        strict = list(
+            iter_adaptive_sweep(
+                points,
+                "average_consumer_price",
+                target_width=0,
+                min_repetitions=3,
+                max_repetitions=6,
+                executor=executor,
+            )
+        )
+        calm_point, noisy_point = sorted(
+            iter_adaptive_sweep(
+                [spec._replace(parameters=calm), spec._replace(parameters=noisy)],
+                "average_consumer_price",
+                target_width=12,
+                min_repetitions=3,
+                max_repetitions=30,
+                executor=executor,
+            ),
+            key=lambda point: point.spec.parameters["marginal_cost"],
+        )
+    assert sorted(point.runs for point in loose) == [3, 3]
+    assert all(point.converged for point in loose)
+    assert sorted(point.runs for point in strict) == [6, 6]
+    assert not any(point.converged for point in strict)
+
+    assert calm_point.runs == 3
+    assert calm_point.runs < noisy_point.runs < 30
+    assert noisy_point.converged and noisy_point.width <= 12
+    assert calm_point.converged and calm_point.width <= 12
+
+
+def _producers(spec: ExperimentSpec) -> dict:
+    parameters = ExperimentParametersSet(
+        **{name: [value] for name, value in spec.parameters.items()},
+        neighborhood=[neighborhood_from(spec.neighborhood)],
+    )
+    runner = Runner(Market, parameters, WithoutCriterion(), max_steps=0)
+    runner.start()
+    market = runner.experiments[0]
+    return {
+        position: market.get_agent(*position).profit_formula
+        for position in market._by_type[Producer.TYPE]
+    }
+
+
+def test_common_random_numbers_are_shared_between_points() -> None:
+    base = ExperimentSpec(
+        parameters=dict(length=10, agent_types=2, marginal_cost=(10, 1), price_ratio=(1.2, 1.5)),
+        neighborhood="Moore",
+        max_steps=0,
+    )
+    specs = common_random_specs(
+        base, repetitions=2, seed=7, antithetic=True, producer_probability=[0.1, 0.3]
+    )
+    assert [spec.parameters["crn_seed"] for spec in specs] == [7, 7, 8, 8] * 2
+    assert [spec.parameters["antithetic"] for spec in specs] == [False, True] * 4
+
+    few, many, mirrored = (_producers(specs[index]) for index in (0, 4, 1))
+    assert len(few) == 10 and len(many) == 30
+    # The producers of the lower probability stay, with the same draws
+    for position, formula in few.items():
+        assert many[position].marginal_cost == formula.marginal_cost
+        assert many[position].price == formula.price
+        assert (
+            many[position]._ProfitFormula__current_factor == formula._ProfitFormula__current_factor
+        )
+    # The antithetic run keeps them in place and mirrors their draws
+    assert mirrored.keys() == few.keys()
+    for position, formula in few.items():
+        assert formula.marginal_cost + mirrored[position].marginal_cost == pytest.approx(20)
+        assert (
+            mirrored[position]._ProfitFormula__current_factor
+            == -formula._ProfitFormula__current_factor
+        )
+    assert _producers(specs[2]).keys() != few.keys()
+
+
+def test_paired_differences_of_common_random_runs(spec) -> None:
+    base = spec._replace(
+        parameters={**spec.parameters, "quantity_to_buy": (3, 1)}, max_steps=8, series=()
+    )
+    specs = common_random_specs(base, repetitions=3, antithetic=True, profit_period=[2, 3])
+    results = [run_experiment(each) for each in specs]
+    values = replicates(results, "average_consumer_price", ["profit_period"])
+    assert list(values) == [(2,), (3,)]
+    assert list(values[(2,)]) == [0, 1, 2]
+    pair = [result.summary["average_consumer_price"] for result in results[:2]]
+    assert values[(2,)][0] == pytest.approx(np.mean(pair))
+
+    difference = paired_difference(values[(2,)], values[(3,)])
+    assert difference.replicates == 3
+    assert difference.mean == pytest.approx(
+        np.mean([values[(3,)][k] - values[(2,)][k] for k in range(3)])
+    )
+    assert paired_difference(values[(2,)], values[(2,)]).width == 0
@@ -0,0 +1,88 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from simulab.simulation.core.equilibrium_criterion import WithoutCriterion
+from simulab.simulation.core.experiment import ExperimentParametersSet
+from simulab.simulation.core.neighborhood import Moore
+from simulab.simulation.core.runner import Runner
+
+from scenarios.monopolios_basic import config as monopolios_basic_conf
+from src.market import Market
+from src.sweep import ExperimentSpec, iter_experiments, sweep_specs
+from src.telemetry import Telemetry
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_progress_is_published_once_per_interval(tmp_path) -> None:
+    clock = Clock()
+    published = []
+    telemetry = Telemetry(
+        callback=published.append, path=tmp_path / "progress.prom", interval=10, clock=clock
+    )
+    telemetry.queue(4, steps_each=100)
+    telemetry.experiment_started()
+    for _ in range(50):
+        clock.now += 0.125
+        telemetry.step_done()
+    assert published == []
+
+    clock.now += 4
+    telemetry.step_done()
+    assert len(published) == 1
+    progress = published[0]
+    assert progress.steps == 51
+    assert progress.steps_per_second == 51 / 10.25
+    assert (progress.experiments_running, progress.experiments_queued) == (1, 3)
+    assert progress.eta_seconds == (400 - 51) / (51 / 10.25)
+    assert progress.workers[telemetry.worker].resident_bytes > 0
+
+    metrics = (tmp_path / "progress.prom").read_text().splitlines()
+    assert "# TYPE market_steps_total counter" in metrics
+    assert f'market_steps_total{{worker="{telemetry.worker}"}} 51' in metrics
+    assert not list(tmp_path.glob(".tmp-*"))
+
+
+def test_markets_report_their_steps() -> None:
+    published = []
+    telemetry = Telemetry(callback=published.append, interval=0)
+    parameters = ExperimentParametersSet(
+        length=[6],
+        agent_types=[2],
+        configuration=[monopolios_basic_conf],
+        quantity_to_buy=[(1, 0)],
+        neighborhood=[Moore],
+        profit_period=[2, 3],
+        telemetry=[telemetry],
+    )
+    Runner(Market, parameters, WithoutCriterion(), max_steps=5).start()
+    assert (telemetry.steps, telemetry.experiments_done) == (10, 2)
+    assert published[-1].experiments_running == 0
+    assert len(published) >= 10
+
+
+def test_sweeps_report_their_workers(tmp_path) -> None:
+    spec = ExperimentSpec(
+        parameters=dict(length=6, agent_types=2, configuration=monopolios_basic_conf),
+        neighborhood="Moore",
+        seed=3,
+        max_steps=4,
+    )
+    specs = sweep_specs(spec, repetitions=2, profit_period=[2, 3])
+    telemetry = Telemetry(path=tmp_path / "sweep.prom", interval=0)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = list(iter_experiments(specs, executor=executor, telemetry=telemetry))
+    assert len(results) == 4
+    assert (telemetry.steps, telemetry.experiments_done) == (16, 4)
+    assert telemetry.experiments_queued == telemetry.experiments_running == 0
+    workers = [sample for name, sample in telemetry.workers.items() if name != telemetry.worker]
+    assert 1 <= len(workers) <= 2
+    assert sum(sample.steps for sample in workers) >= 4
+    assert all(sample.resident_bytes > 0 for sample in workers)
+    assert len(list(tmp_path.glob("worker-*.prom"))) == len(workers)
+    assert "market_experiments_done_total" in (tmp_path / "sweep.prom").read_text()